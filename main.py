@@ -1,4 +1,4 @@
-from neuroquanta import NeuroQuantaNetwork, CosmicResonanceModulator, Tokenizer
+from neuroquanta import NeuroQuantaNetwork, CosmicResonanceModulator, Tokenizer, Instrumentacao, imprimir_progresso
 
 # Exemplo de uso do NeuroQuanta (Sistema de Ressonância Cósmica) para processar textos
 if __name__ == "__main__":
@@ -35,6 +35,10 @@ if __name__ == "__main__":
     # conferindo ao sistema a capacidade única de harmonizar, impulsionar dinâmicamente as ativações
     # e gerar suas próprias respostas de forma adaptativa.
     rede.integrar_transformer(CosmicResonanceModulator(config='inovadora', tem_atencao=True, camadas_atencao=2))
+
+    # Imprime o progresso do treino e da melhoria e mede o tempo de cada fase
+    instrumentacao = Instrumentacao(callbacks=[imprimir_progresso])
+    rede.instrumentar(instrumentacao)
     
     treinamento = [
         (tokenizer.tokenizar("hello"), tokenizer.tokenizar("Hello, how are you?")),
@@ -48,17 +52,19 @@ if __name__ == "__main__":
         (tokenizer.tokenizar("What's up?"), tokenizer.tokenizar("Not much, how about you?")),
     ] * 5
 
-    # Executa o treinamento por 10000 épocas com taxa de aprendizado de 5e-10.
+    # Executa o treinamento por retropropagação em mini-lotes com momentum.
     rede.treinar(
         treinamento,
-        epocas=10000,  # Total de épocas
-        taxa_aprendizado=5e-10,
-        ciclos_melhoria=20,  # 20 ciclos de melhoria durante o treinamento
-        boost_factor=3.0
+        epocas=500,  # Total de épocas
+        taxa_aprendizado=0.01,
+        tamanho_lote=9,
+        momentum=0.9
     )
 
-    for _ in range(0, 2000):
-        rede.melhorar_modelo(epocas=1000) # Melhora o modelo por 1000 épocas e ajusta os parametros para otimizar o modelo e fazer ele aprender melhor
+    rede.melhorar_modelo(epocas=1000) # Ajuste fino final com pequenas perturbações nos parametros
+
+    for fase, medida in instrumentacao.relatorio()["fases"].items():
+        print(f"{fase}: {medida['segundos']:.3f} s em {medida['chamadas']} chamadas")
 
     # Testa a rede após o treinamento.
     print("\nResultados após treinamento no Sistema de Ressonância Cósmica:")
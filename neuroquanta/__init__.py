@@ -1,9 +1,20 @@
 import math
 import random
-import pickle
-import time
+import heapq
+import warnings
+from array import array
+from collections.abc import Iterator
+from contextlib import nullcontext
+from itertools import islice
+from operator import mul
+from .backend import np, resolver_backend, vetor, zeros, para_array
+from .perturbacao import MotorPerturbacao, soma_senos
 from .modulator import CosmicResonanceModulator
 from .tokenizer import Tokenizer
+from .instrumentacao import Instrumentacao, imprimir_progresso, perfil_automatico
+from .cache import CacheLRU, AUSENTE
+from .esparso import VetorEsparso
+from .dados import ConjuntoDados, embaralhar, pre_carregar
 
 # Função de ativação "PulseWave": combina tanh e sin para simular uma dinâmica oscilatória
 def pulse_activation(x):
@@ -15,37 +26,431 @@ def pulse_activation_derivative(x):
     # Derivada de tanh(x) é (1 - tanh(x)**2) e de sin(x) é cos(x); em seguida, normaliza a média.
     return ((1 - math.tanh(x) ** 2) + math.cos(x)) / 2
 
-# Cada célula (nó) da rede, inspirada em neurônios biológicos
+# Ajusta um vetor ao tamanho esperado como o zip das células sempre fez:
+# valores excedentes são ignorados e valores ausentes contam como zero
+def _ajustar(valores, n):
+    if len(valores) == n:
+        return valores
+    valores = list(valores[:n])
+    return valores + [0.0] * (n - len(valores))
+
+# Versão em lote de _ajustar, produzindo uma matriz NumPy (lote x n)
+def _matriz(linhas, n):
+    if isinstance(linhas, np.ndarray) and linhas.ndim == 2 and linhas.shape[1] == n:
+        return linhas.astype(np.float64, copy=False)
+    return np.array([_ajustar(x, n) for x in linhas], dtype=np.float64).reshape(-1, n)
+
+# Os k tokens mais prováveis como pares (id, probabilidade), em ordem decrescente.
+# Usa log-sum-exp para não estourar math.exp com logits grandes e seleção parcial (heap)
+# em vez de ordenar todo o vocabulário.
+def _top_k_probabilidades(logits, k):
+    maximo = max(logits)
+    log_soma = maximo + math.log(math.fsum(math.exp(l - maximo) for l in logits))
+    melhores = heapq.nlargest(k, range(len(logits)), key=logits.__getitem__)
+    return [(i, math.exp(logits[i] - log_soma)) for i in melhores]
+
+# Cada célula (nó) da rede, inspirada em neurônios biológicos.
+# Os parâmetros vivem de forma contígua na Camada; a Celula é apenas uma visão sobre a
+# linha correspondente, mantida para compatibilidade com o código que acessa célula a célula.
 class Celula:
-    def __init__(self, num_entradas):
-        # "forças" substituem os tradicionais pesos
-        self.forcas = [random.uniform(-1, 1) for _ in range(num_entradas)]
-        # Velocidades para atualização com momentum para cada força
-        self.forcas_velocidade = [0.0 for _ in range(num_entradas)]
-        # "tendência" atua como um deslocamento (equivalente ao bias)
-        self.tendencia = random.uniform(-1, 1)
-        self.tendencia_velocidade = 0.0
-        self.saida = 0
-        self.soma_entradas = 0
+    def __init__(self, num_entradas, camada=None, indice=0):
+        if camada is None:
+            # Célula avulsa: recebe uma camada privada de uma única linha
+            camada = Camada(1, num_entradas)
+        self.camada = camada
+        self.indice = indice
+
+    def _linha(self, valores):
+        inicio = self.indice * self.camada.num_entradas
+        fim = inicio + self.camada.num_entradas
+        if isinstance(valores, array):
+            return memoryview(valores)[inicio:fim]
+        return valores[inicio:fim]
+
+    # "forças" substituem os tradicionais pesos
+    @property
+    def forcas(self):
+        return self._linha(self.camada.forcas)
+
+    @forcas.setter
+    def forcas(self, valores):
+        self._linha(self.camada.forcas)[:] = array("d", valores)
+
+    # Velocidades para atualização com momentum para cada força
+    @property
+    def forcas_velocidade(self):
+        return self._linha(self.camada.forcas_velocidade)
+
+    @forcas_velocidade.setter
+    def forcas_velocidade(self, valores):
+        self._linha(self.camada.forcas_velocidade)[:] = array("d", valores)
+
+    # "tendência" atua como um deslocamento (equivalente ao bias)
+    @property
+    def tendencia(self):
+        return self.camada.tendencias[self.indice]
+
+    @tendencia.setter
+    def tendencia(self, valor):
+        self.camada.tendencias[self.indice] = valor
+
+    @property
+    def tendencia_velocidade(self):
+        return self.camada.tendencias_velocidade[self.indice]
+
+    @tendencia_velocidade.setter
+    def tendencia_velocidade(self, valor):
+        self.camada.tendencias_velocidade[self.indice] = valor
+
+    # Após um passo em lote (Camada.frente_lote), saida e soma_entradas são vetores
+    # com um valor por exemplo do lote
+    @property
+    def saida(self):
+        return self.camada._coluna(self.camada.saidas, self.indice)
+
+    @property
+    def soma_entradas(self):
+        return self.camada._coluna(self.camada.somas_entradas, self.indice)
 
     def frente(self, entradas):
+        if self.camada.lote:
+            self.camada._limpar_estado()
         # Soma ponderada das entradas somada à tendência
-        self.soma_entradas = sum(f * e for f, e in zip(self.forcas, entradas)) + self.tendencia
+        soma = sum(f * e for f, e in zip(self.forcas, entradas)) + self.tendencia
+        self.camada.somas_entradas[self.indice] = soma
         # Aplica a função de ativação para obter a saída do neurônio
-        self.saida = pulse_activation(self.soma_entradas)
-        return self.saida
+        saida = pulse_activation(soma)
+        self.camada.saidas[self.indice] = saida
+        return saida
 
-# Camada composta por várias células
+    def __setstate__(self, estado):
+        if "camada" in estado:
+            self.__dict__.update(estado)
+            return
+        # Formato legado (.nqn antigo): a célula guardava as próprias listas
+        camada = Camada.__new__(Camada)
+        camada._montar(
+            [estado["forcas"]], [estado["tendencia"]],
+            [estado.get("forcas_velocidade") or [0.0] * len(estado["forcas"])],
+            [estado.get("tendencia_velocidade", 0.0)],
+        )
+        camada.saidas[0] = estado.get("saida", 0)
+        camada.somas_entradas[0] = estado.get("soma_entradas", 0)
+        self.camada = camada
+        self.indice = 0
+
+# Camada composta por várias células.
+# As forças ficam em uma única matriz contígua (linha por célula, em ordem row-major) e as
+# tendências em um vetor, de modo que o passo para frente é um produto matriz-vetor.
 class Camada:
-    def __init__(self, num_celulas, num_entradas_por_celula):
-        self.celulas = [Celula(num_entradas_por_celula) for _ in range(num_celulas)]
+    # Indica se as entradas do último passo para frente eram esparsas (VetorEsparso)
+    esparsa = False
+
+    def __init__(self, num_celulas, num_entradas_por_celula, backend=None):
+        # Sorteia na mesma ordem das células originais (forças e depois tendência de cada célula)
+        forcas = []
+        tendencias = []
+        for _ in range(num_celulas):
+            forcas.append([random.uniform(-1, 1) for _ in range(num_entradas_por_celula)])
+            tendencias.append(random.uniform(-1, 1))
+        self._montar(forcas, tendencias, backend=backend)
+
+    def _montar(self, forcas, tendencias, forcas_velocidade=None, tendencias_velocidade=None, backend=None):
+        self.backend = resolver_backend(backend)
+        self.num_celulas = len(forcas)
+        self.num_entradas = len(forcas[0]) if forcas else 0
+        total = self.num_celulas * self.num_entradas
+        self.forcas = vetor([f for linha in forcas for f in linha], self.backend)
+        self.tendencias = vetor(tendencias, self.backend)
+        if forcas_velocidade is None:
+            self.forcas_velocidade = zeros(total, self.backend)
+        else:
+            self.forcas_velocidade = vetor([v for linha in forcas_velocidade for v in linha], self.backend)
+        if tendencias_velocidade is None:
+            self.tendencias_velocidade = zeros(self.num_celulas, self.backend)
+        else:
+            self.tendencias_velocidade = vetor(tendencias_velocidade, self.backend)
+        self._limpar_estado()
+        self._celulas = None
+
+    def _limpar_estado(self):
+        # Estado do último passo para frente, usado pela retropropagação
+        self.lote = False
+        self.esparsa = False
+        self.entradas = None
+        self.saidas = zeros(self.num_celulas, self.backend)
+        self.somas_entradas = zeros(self.num_celulas, self.backend)
+
+    def _coluna(self, valores, indice):
+        if not self.lote:
+            return valores[indice]
+        if self.backend == "numpy":
+            return valores[:, indice]
+        return array("d", [linha[indice] for linha in valores])
+
+    @property
+    def celulas(self):
+        # Visões por célula, criadas sob demanda
+        if self._celulas is None:
+            self._celulas = [Celula(self.num_entradas, self, i) for i in range(self.num_celulas)]
+        return self._celulas
 
     def frente(self, entradas):
-        # Propaga os sinais para cada célula da camada
-        return [celula.frente(entradas) for celula in self.celulas]
+        if isinstance(entradas, VetorEsparso):
+            return self.frente_esparsa(entradas)
+        entradas = _ajustar(entradas, self.num_entradas)
+        self.esparsa = False
+        if self.backend == "numpy":
+            matriz = self.forcas.reshape(self.num_celulas, self.num_entradas)
+            somas = matriz @ np.asarray(entradas, dtype=np.float64) + self.tendencias
+            saidas = (np.tanh(somas) + np.sin(somas)) / 2
+            self.lote = False
+            self.entradas = entradas
+            self.somas_entradas = somas
+            self.saidas = saidas
+            return saidas.tolist()
+        # Propaga os sinais: uma soma ponderada por linha da matriz de forças
+        n = self.num_entradas
+        forcas = self.forcas
+        tendencias = self.tendencias
+        somas = array("d", [sum(map(mul, forcas[i * n:(i + 1) * n], entradas)) + tendencias[i]
+                            for i in range(self.num_celulas)])
+        saidas = [pulse_activation(s) for s in somas]
+        self.lote = False
+        self.entradas = entradas
+        self.somas_entradas = somas
+        self.saidas = array("d", saidas)
+        return saidas
+
+    def frente_esparsa(self, vetor):
+        """
+        Passo para frente com uma entrada esparsa (VetorEsparso): soma apenas as colunas da
+        matriz de forças tocadas pela entrada, como uma consulta de embedding, com custo
+        proporcional ao número de não nulos e não a num_entradas.
+        """
+        somas = self._somas_esparsas(vetor)
+        self.lote = False
+        self.esparsa = True
+        self.entradas = vetor
+        self.somas_entradas = somas
+        if self.backend == "numpy":
+            self.saidas = (np.tanh(somas) + np.sin(somas)) / 2
+            return self.saidas.tolist()
+        saidas = [pulse_activation(s) for s in somas]
+        self.saidas = array("d", saidas)
+        return saidas
+
+    def _somas_esparsas(self, vetor):
+        indices, valores = vetor.recortar(self.num_entradas)
+        n = self.num_entradas
+        if self.backend == "numpy":
+            matriz = self.forcas.reshape(self.num_celulas, n)
+            colunas = matriz[:, np.asarray(indices, dtype=np.intp)]
+            return colunas @ np.asarray(valores, dtype=np.float64) + self.tendencias
+        forcas = self.forcas
+        return array("d", [sum([forcas[base + j] * v for j, v in zip(indices, valores)]) + t
+                           for base, t in zip(range(0, self.num_celulas * n, n), self.tendencias)])
+
+    def frente_lote(self, matriz_entradas):
+        """
+        Propaga um lote de entradas (uma linha por exemplo) de uma só vez.
+        Retorna a matriz de saídas no formato nativo do backend: ndarray (lote x células)
+        com NumPy, ou uma lista de array('d') (uma por exemplo) em Python puro.
+        Se alguma linha for um VetorEsparso, o lote inteiro segue o caminho esparso.
+        """
+        if not (np is not None and isinstance(matriz_entradas, np.ndarray)):
+            matriz_entradas = list(matriz_entradas)
+            if any(isinstance(x, VetorEsparso) for x in matriz_entradas):
+                return self._frente_lote_esparso(matriz_entradas)
+        self.esparsa = False
+        if self.backend == "numpy":
+            entradas = _matriz(matriz_entradas, self.num_entradas)
+            matriz = self.forcas.reshape(self.num_celulas, self.num_entradas)
+            somas = entradas @ matriz.T + self.tendencias
+            saidas = (np.tanh(somas) + np.sin(somas)) / 2
+        else:
+            n = self.num_entradas
+            forcas = self.forcas
+            linhas = [forcas[i * n:(i + 1) * n] for i in range(self.num_celulas)]
+            tendencias = self.tendencias
+            entradas = []
+            somas = []
+            saidas = []
+            for x in matriz_entradas:
+                x = _ajustar(x, n)
+                entradas.append(x)
+                s = array("d", [sum(map(mul, linha, x)) + t for linha, t in zip(linhas, tendencias)])
+                somas.append(s)
+                saidas.append(array("d", [pulse_activation(v) for v in s]))
+        self.lote = True
+        self.entradas = entradas
+        self.somas_entradas = somas
+        self.saidas = saidas
+        return saidas
+
+    def _frente_lote_esparso(self, linhas):
+        entradas = [x if isinstance(x, VetorEsparso) else VetorEsparso.de_denso(_ajustar(x, self.num_entradas))
+                    for x in linhas]
+        somas = [self._somas_esparsas(x) for x in entradas]
+        if self.backend == "numpy":
+            somas = np.array(somas).reshape(len(entradas), self.num_celulas)
+            saidas = (np.tanh(somas) + np.sin(somas)) / 2
+        else:
+            saidas = [array("d", [pulse_activation(v) for v in s]) for s in somas]
+        self.lote = True
+        self.esparsa = True
+        self.entradas = entradas
+        self.somas_entradas = somas
+        self.saidas = saidas
+        return saidas
+
+    def _estado_lote(self):
+        # Entradas e somas do último passo para frente, sempre no formato de lote
+        # (entradas esparsas continuam como listas de VetorEsparso)
+        if self.esparsa:
+            entradas = self.entradas if self.lote else [self.entradas]
+            if self.backend == "numpy":
+                return entradas, np.atleast_2d(self.somas_entradas)
+            return entradas, self.somas_entradas if self.lote else [self.somas_entradas]
+        if self.backend == "numpy":
+            entradas = np.asarray(self.entradas, dtype=np.float64)
+            return np.atleast_2d(entradas), np.atleast_2d(self.somas_entradas)
+        if self.lote:
+            return self.entradas, self.somas_entradas
+        return [self.entradas], [self.somas_entradas]
+
+    def derivadas(self):
+        """
+        Derivada da ativação PulseWave nas somas do último passo para frente (formato de lote).
+        """
+        _, somas = self._estado_lote()
+        if self.backend == "numpy":
+            return ((1 - np.tanh(somas) ** 2) + np.cos(somas)) / 2
+        return [array("d", [pulse_activation_derivative(s) for s in linha]) for linha in somas]
+
+    def gradientes(self, deltas):
+        """
+        Gradientes médios no lote das forças e tendências, dados os deltas (erro local já
+        multiplicado pela derivada da ativação) de cada célula para cada exemplo.
+        """
+        entradas, _ = self._estado_lote()
+        n = self.num_entradas
+        if self.backend == "numpy":
+            lote = deltas.shape[0]
+            if not self.esparsa:
+                return (deltas.T @ entradas).ravel() / lote, deltas.sum(axis=0) / lote
+            # Só as colunas tocadas por cada entrada recebem gradiente
+            g_forcas = np.zeros((self.num_celulas, n))
+            for x, d in zip(entradas, deltas):
+                indices, valores = x.recortar(n)
+                g_forcas[:, np.asarray(indices, dtype=np.intp)] += np.outer(d, valores)
+            return g_forcas.ravel() / lote, deltas.sum(axis=0) / lote
+        lote = len(deltas)
+        g_forcas = array("d", bytes(8 * self.num_celulas * n))
+        g_tendencias = array("d", bytes(8 * self.num_celulas))
+        if self.esparsa:
+            for x, d in zip(entradas, deltas):
+                indices, valores = x.recortar(n)
+                for c, dc in enumerate(d):
+                    if dc:
+                        base = c * n
+                        for j, v in zip(indices, valores):
+                            g_forcas[base + j] += dc * v
+                        g_tendencias[c] += dc
+            return array("d", [g / lote for g in g_forcas]), array("d", [g / lote for g in g_tendencias])
+        for x, d in zip(entradas, deltas):
+            for c, dc in enumerate(d):
+                if dc:
+                    base = c * n
+                    g_forcas[base:base + n] = array("d", [g + dc * e for g, e in zip(g_forcas[base:base + n], x)])
+                    g_tendencias[c] += dc
+        return array("d", [g / lote for g in g_forcas]), array("d", [g / lote for g in g_tendencias])
+
+    def propagar_deltas(self, deltas):
+        """
+        Leva os deltas desta camada de volta às suas entradas (deltas x matriz de forças).
+        """
+        if self.backend == "numpy":
+            return deltas @ self.forcas.reshape(self.num_celulas, self.num_entradas)
+        n = self.num_entradas
+        forcas = self.forcas
+        linhas = [forcas[i * n:(i + 1) * n] for i in range(self.num_celulas)]
+        resultado = []
+        for d in deltas:
+            acumulado = [0.0] * n
+            for linha, dc in zip(linhas, d):
+                if dc:
+                    acumulado = [a + dc * f for a, f in zip(acumulado, linha)]
+            resultado.append(array("d", acumulado))
+        return resultado
+
+    def aplicar_gradientes(self, g_forcas, g_tendencias, taxa_aprendizado, momentum=0.0):
+        """
+        Atualiza forças e tendências com descida do gradiente usando os buffers de velocidade:
+        v = momentum * v - taxa * g; parametro += v.
+        """
+        pares = ((self.forcas, self.forcas_velocidade, g_forcas),
+                 (self.tendencias, self.tendencias_velocidade, g_tendencias))
+        for valores, velocidade, gradiente in pares:
+            if self.backend == "numpy":
+                velocidade *= momentum
+                velocidade -= taxa_aprendizado * gradiente
+                valores += velocidade
+            else:
+                velocidade[:] = array("d", [momentum * v - taxa_aprendizado * g for v, g in zip(velocidade, gradiente)])
+                valores[:] = array("d", [p + v for p, v in zip(valores, velocidade)])
+
+    def __getstate__(self):
+        # Serializa sempre em array('d'), para que o modelo carregue com ou sem NumPy
+        return {
+            "num_celulas": self.num_celulas,
+            "num_entradas": self.num_entradas,
+            "forcas": para_array(self.forcas),
+            "tendencias": para_array(self.tendencias),
+            "forcas_velocidade": para_array(self.forcas_velocidade),
+            "tendencias_velocidade": para_array(self.tendencias_velocidade),
+        }
+
+    def __setstate__(self, estado):
+        if "celulas" in estado:
+            # Formato legado: lista de objetos Celula com parâmetros próprios
+            celulas = estado["celulas"]
+            self._montar(
+                [list(c.forcas) for c in celulas],
+                [c.tendencia for c in celulas],
+                [list(c.forcas_velocidade) for c in celulas],
+                [c.tendencia_velocidade for c in celulas],
+            )
+            return
+        backend = resolver_backend()
+        self._usar_vetores(estado["num_celulas"], estado["num_entradas"],
+                           *(vetor(estado[nome], backend) for nome in Camada.VETORES), backend=backend)
+
+    # Nomes dos vetores de parâmetros, na ordem em que são serializados
+    VETORES = ("forcas", "tendencias", "forcas_velocidade", "tendencias_velocidade")
+
+    def _usar_vetores(self, num_celulas, num_entradas, forcas, tendencias, forcas_velocidade,
+                      tendencias_velocidade, backend):
+        # Adota vetores já prontos (inclusive visões sem cópia sobre um arquivo mapeado em memória)
+        self.backend = backend
+        self.num_celulas = num_celulas
+        self.num_entradas = num_entradas
+        self.forcas = forcas
+        self.tendencias = tendencias
+        self.forcas_velocidade = forcas_velocidade
+        self.tendencias_velocidade = tendencias_velocidade
+        self._limpar_estado()
+        self._celulas = None
 
 # Rede Neural NeuroQuanta: arquitetura inovadora com integração de transformer para geração de respostas
 class NeuroQuantaNetwork:
+    # Instrumentação opcional (ver neuroquanta.instrumentacao); None desliga todas as medições
+    instrumentacao = None
+    # Versão dos parâmetros, incrementada a cada alteração do modelo, e cache opcional de
+    # resultados (ver ativar_cache)
+    versao = 0
+    cache = None
+
     def __init__(self, tamanho_entrada, tamanho_oculto, tamanho_saida):
         self.tamanho_entrada = tamanho_entrada
         self.tamanho_oculto = tamanho_oculto
@@ -57,134 +462,542 @@ class NeuroQuantaNetwork:
     # Novo método para integrar um transformer (ex.: CosmicResonanceModulator)
     def integrar_transformer(self, transformer):
         self.transformer = transformer
+        if self.instrumentacao is not None:
+            transformer.instrumentacao = self.instrumentacao
+        self.invalidar_cache()
+
+    def ativar_cache(self, capacidade=1024):
+        """
+        Liga um cache LRU de até `capacidade` resultados de prever e gerar_resposta (com
+        capacidade None, desliga). O cache só é usado quando as saídas são reproduzíveis: sem
+        transformer, ou com um modulador com semente. Neste caso, toda chamada com cache é
+        calculada com os geradores reiniciados pela semente (ver CosmicResonanceModulator.semeado),
+        de modo que um acerto devolve exatamente o que um novo cálculo daria. Sem semente, o
+        jitter e o impulso das linhas presas são aleatórios e o cache é ignorado. Ele é esvaziado
+        sempre que a versão dos parâmetros muda (treinar, melhorar_modelo, integrar_transformer...).
+        Um acerto em prever não passa pelas camadas: o estado do último passo para frente é
+        descartado, e retropropagar exige um novo prever/prever_lote.
+        Estatísticas em rede.cache.estatisticas().
+        """
+        self.cache = CacheLRU(capacidade) if capacidade else None
+
+    def invalidar_cache(self):
+        """
+        Incrementa a versão dos parâmetros, descartando os resultados em cache. Chame após
+        alterar forças, tendências ou o transformer diretamente.
+        """
+        self.versao += 1
+
+    def _cache_ativo(self):
+        cache = self.cache
+        if cache is None:
+            return None
+        transformer = self.transformer
+        if transformer is not None and getattr(transformer, "semente", None) is None:
+            return None
+        cache.validar(self.versao)
+        return cache
+
+    def _reproduzivel(self):
+        # Contexto das chamadas com cache: geradores do transformer reiniciados pela semente
+        if self.transformer is None:
+            return nullcontext()
+        return self.transformer.semeado()
+
+    def _chave_cache(self, *partes):
+        # A semente do transformer entra na chave: semear outra semente muda os resultados
+        semente = self.transformer.semente if self.transformer is not None else None
+        return partes + (semente,)
+
+    def instrumentar(self, instrumentacao):
+        """
+        Liga (ou, com None, desliga) a instrumentação da rede e do transformer integrado:
+        eventos de progresso, tempos por fase e perfil (ver neuroquanta.instrumentacao).
+        """
+        self.instrumentacao = instrumentacao
+        if self.transformer is not None:
+            if instrumentacao is None:
+                vars(self.transformer).pop("instrumentacao", None)
+            else:
+                self.transformer.instrumentacao = instrumentacao
 
     def prever(self, entradas):
+        cache = self._cache_ativo()
+        if cache is None:
+            return self._prever(entradas)
+        chave = self._chave_cache("prever", entradas if isinstance(entradas, VetorEsparso) else tuple(entradas))
+        saida = cache.obter(chave)
+        if saida is AUSENTE:
+            with self._reproduzivel():
+                saida = tuple(self._prever(entradas))
+            cache.guardar(chave, saida)
+        else:
+            # O acerto não passa pelas camadas: o estado guardado seria de outra entrada
+            self.camada_oculta._limpar_estado()
+            self.camada_saida._limpar_estado()
+        return list(saida)
+
+    def _prever(self, entradas):
+        inst = self.instrumentacao
+        inicio = inst.relogio() if inst is not None else 0.0
         saida_oculta = self.camada_oculta.frente(entradas)
+        if inst is not None:
+            inst.fase("frente", inicio)
         if self.transformer is not None:
             saida_oculta = self.transformer.transform(saida_oculta)
+        if inst is not None:
+            inicio = inst.relogio()
         saida = self.camada_saida.frente(saida_oculta)
+        if inst is not None:
+            inst.fase("frente", inicio)
         return saida
 
-    def treinar(self, dados_treinamento, epocas, taxa_aprendizado=0.0000000005, ciclos_melhoria=5, boost_factor=1.5):
+    def prever_lote(self, matriz_entradas):
+        """
+        Versão em lote de prever: propaga todas as entradas pelas duas camadas e pelo
+        transformer como operações de matriz. Retorna uma linha de saída por entrada.
         """
-        Método de treinamento aprimorado com ciclos de melhoria integrados
+        inst = self.instrumentacao
+        inicio = inst.relogio() if inst is not None else 0.0
+        saida_oculta = self.camada_oculta.frente_lote(matriz_entradas)
+        if inst is not None:
+            inst.fase("frente", inicio)
+        if self.transformer is not None:
+            saida_oculta = self.transformer.transform_lote(saida_oculta)
+        if inst is not None:
+            inicio = inst.relogio()
+        saida = self.camada_saida.frente_lote(saida_oculta)
+        if inst is not None:
+            inst.fase("frente", inicio)
+        if self.camada_saida.backend == "numpy":
+            return saida.tolist()
+        return [list(linha) for linha in saida]
+
+    def avaliar(self, dados):
         """
+        Erro médio da rede (mesma medida de retropropagar) sobre pares (entrada, saida_esperada),
+        sem alterar os parâmetros.
+        """
+        dados = list(dados)
+        if not dados:
+            return 0.0
+        saidas = self.prever_lote([entrada for entrada, _ in dados])
+        n = self.camada_saida.num_celulas
+        total = 0.0
+        for saida, (_, alvo) in zip(saidas, dados):
+            total += sum((y - t) ** 2 for y, t in zip(saida, _ajustar(alvo, n)))
+        return total / len(dados) / 2
+
+    def treinar(self, dados_treinamento, epocas, taxa_aprendizado=0.0000000005, ciclos_melhoria=0, boost_factor=1.5,
+                tamanho_lote=16, momentum=0.9, trabalhadores=None, semente=None):
+        """
+        Treina a rede com descida do gradiente em mini-lotes (retropropagação com momentum).
+        Os pares (entrada, saida_esperada) são lidos em lotes de tamanho_lote; cada lote passa
+        por prever_lote e retropropagar. Se ciclos_melhoria > 0, intercala ciclos de melhoria
+        aleatória (melhorar_modelo) com taxa ampliada por boost_factor.
+        Com trabalhadores > 1, cada lote é dividido entre processos que calculam os gradientes
+        em paralelo (ver neuroquanta.paralelo); semente torna esse modo determinístico. O custo
+        fixo de cada passo paralelo só compensa com lotes grandes (tamanho_lote >= LOTE_MINIMO,
+        256; abaixo disso é emitido um aviso).
+        O progresso é entregue como eventos "passo", "epoca" e "reforco" à instrumentação
+        da rede, se houver (ver instrumentar). Retorna o erro médio da última época.
+        dados_treinamento pode ser qualquer iterável que possa ser percorrido uma vez por época
+        (lista, ConjuntoDados...); só um lote fica em memória por vez.
+        """
+        if epocas > 1 and isinstance(dados_treinamento, Iterator):
+            raise TypeError("dados_treinamento é um iterador de uso único; use uma lista ou um iterável "
+                            "que possa ser percorrido a cada época (ex.: ConjuntoDados).")
+        paralelo = None
+        if trabalhadores is not None and trabalhadores > 1:
+            from .paralelo import TreinoParalelo, LOTE_MINIMO
+            if tamanho_lote < LOTE_MINIMO:
+                warnings.warn(f"treinar com trabalhadores={trabalhadores} e tamanho_lote={tamanho_lote}: abaixo de "
+                              f"{LOTE_MINIMO} exemplos por lote, o custo fixo de cada passo paralelo supera o "
+                              "ganho e o treino fica mais lento que o serial.", RuntimeWarning, stacklevel=2)
+            paralelo = TreinoParalelo(self, trabalhadores, semente)
+        try:
+            with perfil_automatico(self.instrumentacao):
+                return self._treinar(dados_treinamento, epocas, taxa_aprendizado, ciclos_melhoria, boost_factor,
+                                     tamanho_lote, momentum, paralelo)
+        finally:
+            self.invalidar_cache()
+            if paralelo is not None:
+                paralelo.fechar()
+
+    def _treinar(self, dados_treinamento, epocas, taxa_aprendizado, ciclos_melhoria, boost_factor,
+                 tamanho_lote, momentum, paralelo):
+        inst = self.instrumentacao
+        intervalo = max(1, epocas // ciclos_melhoria) if ciclos_melhoria else 0
+        erro_epoca = 0.0
         for epoca in range(epocas):
             # Fase de treinamento padrão
-            for entrada, saida_esperada in dados_treinamento:
-                saida = self.prever(entrada)
-                self.retropropagar(saida_esperada, taxa_aprendizado)
-            
+            inicio_epoca = inst.relogio() if inst is not None else 0.0
+            iterador = iter(dados_treinamento)
+            erro_total = 0.0
+            lotes = 0
+            exemplos = 0
+            while True:
+                lote = list(islice(iterador, tamanho_lote))
+                if not lote:
+                    break
+                entradas = [entrada for entrada, _ in lote]
+                alvos = [saida for _, saida in lote]
+                if paralelo is not None:
+                    erro = paralelo.passo(entradas, alvos, taxa_aprendizado, momentum)
+                else:
+                    self.prever_lote(entradas)
+                    inicio = inst.relogio() if inst is not None else 0.0
+                    erro = self.retropropagar(alvos, taxa_aprendizado, momentum)
+                    if inst is not None:
+                        inst.fase("retropropagacao", inicio)
+                erro_total += erro
+                lotes += 1
+                exemplos += len(lote)
+                if inst is not None:
+                    inst.contar("exemplos", len(lote))
+                    inst.evento("passo", epoca=epoca + 1, lote=lotes, exemplos=len(lote), erro=erro)
+            erro_epoca = erro_total / lotes if lotes else 0.0
+            if inst is not None:
+                inst.evento("epoca", epoca=epoca + 1, epocas=epocas, erro=erro_epoca, exemplos=exemplos,
+                            segundos=inst.relogio() - inicio_epoca)
+
             # Fase de melhoria a cada ciclo
-            if (epoca + 1) % (epocas//ciclos_melhoria) == 0:
+            if intervalo and (epoca + 1) % intervalo == 0:
                 # Aumenta temporariamente a taxa de aprendizado
                 self.melhorar_modelo(epocas=100, 
                                    taxa_aprendizado=taxa_aprendizado*boost_factor)
-                
-                print(f"Treinamento {epoca+1}/{epocas} completado com reforço")
+                if inst is not None:
+                    inst.evento("reforco", epoca=epoca + 1, epocas=epocas)
+        return erro_epoca
 
-    def retropropagar(self, saida_esperada, taxa_aprendizado):
-        # Implemente a retropropagação para atualizar os pesos e vieses
-        pass
+    def calcular_gradientes(self, saida_esperada):
+        """
+        Calcula os gradientes do erro quadrático médio em relação às forças e tendências,
+        a partir do estado guardado pelo último prever/prever_lote. saida_esperada é um vetor
+        (após prever) ou uma matriz com uma linha por exemplo (após prever_lote).
+        Retorna (erro, [(g_forcas, g_tendencias) da camada oculta, ... da camada de saída]).
+        """
+        oculta = self.camada_oculta
+        saida = self.camada_saida
+        if oculta.entradas is None or saida.entradas is None:
+            raise RuntimeError("Sem estado do passo para frente: chame prever ou prever_lote (sem acerto "
+                               "no cache) antes de calcular_gradientes/retropropagar.")
+        if saida.backend == "numpy":
+            alvos = _matriz(saida_esperada if saida.lote else [saida_esperada], saida.num_celulas)
+            diferenca = np.atleast_2d(saida.saidas) - alvos
+            erro = float((diferenca ** 2).sum(axis=1).mean()) / 2
+            deltas_saida = diferenca * saida.derivadas()
+            deltas_oculta = saida.propagar_deltas(deltas_saida)
+            if self.transformer is not None:
+                deltas_oculta = self.transformer.retropropagar_atencao(deltas_oculta)
+                deltas_oculta = deltas_oculta * self.transformer.derivada(np.atleast_2d(oculta.saidas))
+            deltas_oculta = deltas_oculta * oculta.derivadas()
+        else:
+            saidas = saida.saidas if saida.lote else [saida.saidas]
+            alvos = [_ajustar(alvo, saida.num_celulas) for alvo in (saida_esperada if saida.lote else [saida_esperada])]
+            diferencas = [[y - t for y, t in zip(linha, alvo)] for linha, alvo in zip(saidas, alvos)]
+            erro = sum(sum(d * d for d in linha) for linha in diferencas) / len(diferencas) / 2
+            deltas_saida = [[d * f for d, f in zip(linha, derivada)]
+                            for linha, derivada in zip(diferencas, saida.derivadas())]
+            deltas_oculta = saida.propagar_deltas(deltas_saida)
+            if self.transformer is not None:
+                deltas_oculta = self.transformer.retropropagar_atencao(deltas_oculta)
+                saidas_ocultas = oculta.saidas if oculta.lote else [oculta.saidas]
+                deltas_oculta = [[d * m for d, m in zip(linha, derivada)]
+                                 for linha, derivada in zip(deltas_oculta, self.transformer.derivada(saidas_ocultas))]
+            deltas_oculta = [[d * f for d, f in zip(linha, derivada)]
+                             for linha, derivada in zip(deltas_oculta, oculta.derivadas())]
+        return erro, [oculta.gradientes(deltas_oculta), saida.gradientes(deltas_saida)]
+
+    def aplicar_gradientes(self, gradientes, taxa_aprendizado, momentum=0.9):
+        """
+        Aplica os gradientes retornados por calcular_gradientes às duas camadas.
+        """
+        for camada, (g_forcas, g_tendencias) in zip([self.camada_oculta, self.camada_saida], gradientes):
+            camada.aplicar_gradientes(g_forcas, g_tendencias, taxa_aprendizado, momentum)
+        self.invalidar_cache()
+
+    def retropropagar(self, saida_esperada, taxa_aprendizado, momentum=0.9):
+        """
+        Retropropaga o erro do último prever/prever_lote e atualiza forças e tendências com
+        momentum. O transformer é atravessado pela Jacobiana das camadas de atenção e pela
+        derivada da sua modulação harmônica.
+        Retorna o erro quadrático médio (metade da soma por exemplo) do lote.
+        """
+        erro, gradientes = self.calcular_gradientes(saida_esperada)
+        self.aplicar_gradientes(gradientes, taxa_aprendizado, momentum)
+        return erro
 
-    def melhorar_modelo(self, epocas, taxa_aprendizado=0.0000000005):
+    def melhorar_modelo(self, epocas, taxa_aprendizado=0.0000000005, fundir_epocas=True, semente=None,
+                        modo='aleatorio', dados_avaliacao=None, populacao=8, trabalhadores=None):
         """
         Método para melhorar (fine-tuning) o modelo com ajustes finos dos parâmetros.
         Executa uma série de iterações que aplicam pequenas alterações aleatórias nos pesos
         e vieses das células para otimizar o desempenho da rede.
+        Cada época soma a cada parâmetro um sorteio uniforme em ±(boost * taxa_aprendizado),
+        gerado em bloco para todas as camadas. Com fundir_epocas, as épocas entre dois avisos
+        de progresso são aplicadas em um único passo (ver MotorPerturbacao).
+        Com modo='evolucao', cada época é uma geração de uma estratégia de evolução: `populacao`
+        candidatos são avaliados em dados_avaliacao (em `trabalhadores` processos, se > 1) e só
+        se mantém uma mudança que reduza o erro (ver neuroquanta.evolucao). Nesse modo, retorna
+        o erro de avaliação final.
+        O progresso é entregue como evento "melhoria" à instrumentação da rede, se houver.
         """
-        momentum = 0.97
+        if modo not in ('aleatorio', 'evolucao'):
+            raise ValueError(f"modo deve ser 'aleatorio' ou 'evolucao', recebido {modo!r}.")
+        try:
+            with perfil_automatico(self.instrumentacao):
+                if modo == 'evolucao':
+                    return self._melhorar_evolucao(epocas, taxa_aprendizado, semente, dados_avaliacao, populacao,
+                                                   trabalhadores)
+                self._melhorar_aleatorio(epocas, taxa_aprendizado, fundir_epocas, semente)
+        finally:
+            self.invalidar_cache()
+
+    def _melhorar_aleatorio(self, epocas, taxa_aprendizado, fundir_epocas, semente):
+        inst = self.instrumentacao
         boost_factor = 1.2
-        for epoca in range(epocas):
+        escala = boost_factor * taxa_aprendizado
+        motor = MotorPerturbacao(semente)
+        camadas = [self.camada_oculta, self.camada_saida]
+        epoca = 0
+        while epoca < epocas:
+            # Funde as épocas até o próximo aviso de progresso (a cada 100 épocas)
+            passos = min(100 - epoca % 100, epocas - epoca) if fundir_epocas else 1
             # Ajuste fino: pequenas perturbações aleatórias nos pesos e bias de cada célula
-            for camada in [self.camada_oculta, self.camada_saida]:
-                for celula in camada.celulas:
-                    for i in range(len(celula.forcas)):
-                        ajuste = boost_factor * taxa_aprendizado * random.uniform(-1.0, 1.0)
-                        celula.forcas[i] += ajuste
-                    celula.tendencia += boost_factor * taxa_aprendizado * random.uniform(-1.0, 1.0)
+            inicio = inst.relogio() if inst is not None else 0.0
+            motor.perturbar(camadas, escala, passos)
+            if inst is not None:
+                inst.fase("perturbacao", inicio)
             # Ajuste adicional no módulo transformer, se integrado
             if self.transformer is not None:
-                self.transformer.modulation += boost_factor * taxa_aprendizado * math.sin(epoca)
-            # Exibe um aviso a cada 100 épocas para acompanhar o avanço
-            if (epoca + 1) % 100 == 0:
-                print(f"Melhoria {epoca + 1}/{epocas} executada.")
+                self.transformer.modulation += escala * soma_senos(epoca, epoca + passos)
+            epoca += passos
+            # Avisa a cada 100 épocas para acompanhar o avanço
+            if inst is not None and epoca % 100 == 0:
+                inst.evento("melhoria", epoca=epoca, epocas=epocas)
+
+    def _melhorar_evolucao(self, epocas, taxa_aprendizado, semente, dados_avaliacao, populacao, trabalhadores):
+        from .evolucao import BuscaEvolutiva
+
+        if dados_avaliacao is None:
+            raise ValueError("O modo 'evolucao' precisa de dados_avaliacao.")
+        inst = self.instrumentacao
+        boost_factor = 1.2
+        escala = boost_factor * taxa_aprendizado
+        erro = None
+        with BuscaEvolutiva(self, dados_avaliacao, populacao, trabalhadores, semente) as busca:
+            for geracao in range(epocas):
+                erro = busca.geracao(escala)
+                # Avisa a cada 100 gerações para acompanhar o avanço
+                if inst is not None and (geracao + 1) % 100 == 0:
+                    inst.evento("melhoria", epoca=geracao + 1, epocas=epocas, erro=erro)
+        return erro
 
     def salvar_modelo(self, nome_arquivo):
         """
         Salva o modelo atual em um arquivo com o nome especificado.
-        O modelo é serializado como um arquivo com extensão .nqn.
+        O modelo é gravado no formato binário versionado .nqn (ver neuroquanta.formato):
+        um cabeçalho com a arquitetura e o transformer, seguido dos vetores de parâmetros.
         """
+        from .formato import salvar
         arquivo = nome_arquivo + ".nqn"
-        with open(arquivo, "wb") as f:
-            pickle.dump(self, f)
+        salvar(self, arquivo)
         print(f"Modelo salvo em {arquivo}")
 
     @classmethod
-    def carregar_modelo(cls, nome_arquivo):
+    def carregar_modelo(cls, nome_arquivo, backend=None, permitir_legado=False):
         """
         Carrega e retorna um modelo salvo a partir do arquivo especificado.
+        O arquivo é mapeado em memória e os parâmetros são usados sem cópia.
+        Arquivos no formato legado (pickle) só são aceitos com permitir_legado=True, pois podem
+        executar código; use neuroquanta.formato.converter_legado para convertê-los.
         """
+        from .formato import carregar
         arquivo = nome_arquivo + ".nqn"
-        with open(arquivo, "rb") as f:
-            modelo = pickle.load(f)
+        modelo = carregar(arquivo, backend=backend, permitir_legado=permitir_legado)
         print(f"Modelo carregado de {arquivo}")
         return modelo
 
-    def gerar_resposta(self, prompt_tokens, max_steps, mostrar_tokens_atencao=False, 
-                      tokenizer=None, prompt_text="", penalidade_repeticao=0.7):
+    def gerar_resposta_stream(self, prompt_tokens, max_steps, tokenizer=None, penalidade_repeticao=0.7,
+                              top_k=0, tamanho_vocab=None):
+        """
+        Gera a resposta token a token, entregando cada id assim que é escolhido.
+        A penalidade de repetição é aplicada apenas aos tokens já gerados (mantidos em um dicionário
+        com o fator acumulado de cada um), e a escolha é o argmax dos logits penalizados.
+        Com top_k > 0, entrega (token_id, topo), onde topo lista os k tokens mais prováveis como
+        pares (id, probabilidade), calculados com log-sum-exp estável e seleção parcial.
+        """
         if self.transformer is None:
             raise Exception("Transformer não integrado. Use integrar_transformer para integrá-lo.")
-        
-        # Convert prompt tokens to initial activations
-        current = [0.0] * len(tokenizer.vocab)
-        for idx in prompt_tokens:
-            if idx < len(current):
-                current[idx] = 1.0  # Ativação inicial para tokens do prompt
-        
-        resposta = []
-        tokens_atencao = []
-        generated_token_ids = []
-        
-        for step in range(max_steps):
+        if tamanho_vocab is None:
+            tamanho_vocab = len(tokenizer.vocab)
+
+        # Ativação inicial 1.0 para os tokens do prompt, em forma esparsa: o primeiro passo
+        # do modulador só calcula a modulação desses tokens
+        current = VetorEsparso.one_hot(prompt_tokens, tamanho_vocab)
+
+        # Fator de penalidade acumulado por token já gerado
+        penalidades = {}
+        inst = self.instrumentacao
+        for passo in range(max_steps):
             # Aplica a transformação do módulo Cosmic
             current = self.transformer.transform(current)
-            
-            # Aplica penalidade de repetição
-            logits = current.copy()
-            for token_id in generated_token_ids:
+
+            inicio = inst.relogio() if inst is not None else 0.0
+            # Aplica penalidade de repetição somente aos tokens já vistos
+            logits = list(current)
+            for token_id, fator in penalidades.items():
                 if token_id < len(logits):
-                    logits[token_id] *= penalidade_repeticao
-                    
-            # Calcula probabilidades
-            exp_logits = [math.exp(l) for l in logits]
-            sum_exp = sum(exp_logits)
-            probs = [e / sum_exp for e in exp_logits]
-            
-            # Seleciona o próximo token
-            token_id = probs.index(max(probs))
-            generated_token_ids.append(token_id)
+                    logits[token_id] *= fator
+
+            # O softmax é monotônico: o token mais provável é o de maior logit
+            token_id = logits.index(max(logits))
+            penalidades[token_id] = penalidades.get(token_id, 1.0) * penalidade_repeticao
+
+            topo = _top_k_probabilidades(logits, top_k) if top_k > 0 else None
+            if inst is not None:
+                inst.fase("softmax", inicio)
+                inst.contar("tokens")
+                inst.evento("token", passo=passo + 1, token_id=token_id, topo=topo)
+
+            if top_k > 0:
+                yield token_id, topo
+            else:
+                yield token_id
+
+    def gerar_resposta_lote(self, lista_prompts, max_steps, tokenizer=None, penalidade_repeticao=0.7,
+                            token_parada=None, tamanho_vocab=None, ao_terminar=None):
+        """
+        Gera respostas para vários prompts de uma vez, avançando todos juntos.
+        O estado é uma matriz (prompts x vocabulário) transformada com transform_lote a cada passo,
+        e a penalidade de repetição é uma matriz de fatores aplicada por linha. Uma sequência que
+        gera token_parada termina (sem incluí-lo) e sai do lote, sem atrasar as demais.
+        max_steps é um número para todos os prompts ou uma sequência com o limite de cada um;
+        uma sequência que atinge o seu limite também sai do lote. Se informado, ao_terminar é
+        chamado com (indice, resposta) assim que cada sequência termina.
+        Retorna uma lista de respostas (listas de ids), na ordem dos prompts.
+        """
+        if self.transformer is None:
+            raise Exception("Transformer não integrado. Use integrar_transformer para integrá-lo.")
+        if tamanho_vocab is None:
+            tamanho_vocab = len(tokenizer.vocab)
+        respostas = [[] for _ in lista_prompts]
+        if not respostas:
+            return respostas
+        limites = [max_steps] * len(respostas) if isinstance(max_steps, int) else list(max_steps)
+        if len(limites) != len(respostas):
+            raise ValueError("max_steps deve ter um limite por prompt.")
+        max_steps = max(limites)
+        if ao_terminar is not None:
+            for linha, limite in enumerate(limites):
+                if limite <= 0:
+                    ao_terminar(linha, respostas[linha])
+
+        # Estado inicial esparso (one-hot dos tokens de cada prompt)
+        iniciais = [VetorEsparso.one_hot(prompt, tamanho_vocab) for prompt in lista_prompts]
+        if self.camada_oculta.backend == "numpy":
+            limites = np.asarray(limites)
+            ativos = np.flatnonzero(limites > 0)
+            current = [iniciais[linha] for linha in ativos.tolist()]
+            fatores = np.ones((len(ativos), tamanho_vocab))
+            inst = self.instrumentacao
+            for passo in range(max_steps):
+                if not len(ativos):
+                    break
+                current = np.asarray(self.transformer.transform_lote(current), dtype=np.float64)
+                inicio = inst.relogio() if inst is not None else 0.0
+                escolhidos = np.argmax(current * fatores, axis=1)
+                fatores[np.arange(len(ativos)), escolhidos] *= penalidade_repeticao
+                if inst is not None:
+                    inst.fase("softmax", inicio)
+                    inst.contar("tokens", len(ativos))
+                continuar = limites[ativos] > passo + 1
+                if token_parada is not None:
+                    continuar &= escolhidos != token_parada
+                for linha, token_id, segue in zip(ativos.tolist(), escolhidos.tolist(), continuar.tolist()):
+                    if token_id != token_parada:
+                        respostas[linha].append(token_id)
+                    if not segue and ao_terminar is not None:
+                        ao_terminar(linha, respostas[linha])
+                if not continuar.all():
+                    ativos = ativos[continuar]
+                    current = current[continuar]
+                    fatores = fatores[continuar]
+            return respostas
+
+        penalidades = [{} for _ in respostas]
+        ativos = [linha for linha in range(len(respostas)) if limites[linha] > 0]
+        current = [iniciais[linha] for linha in ativos]
+        inst = self.instrumentacao
+        for passo in range(max_steps):
+            if not ativos:
+                break
+            current = self.transformer.transform_lote(current)
+            inicio = inst.relogio() if inst is not None else 0.0
+            if inst is not None:
+                inst.contar("tokens", len(ativos))
+            restantes = []
+            for posicao, linha in enumerate(ativos):
+                logits = list(current[posicao])
+                for token_id, fator in penalidades[linha].items():
+                    logits[token_id] *= fator
+                token_id = logits.index(max(logits))
+                penalidades[linha][token_id] = penalidades[linha].get(token_id, 1.0) * penalidade_repeticao
+                if token_id != token_parada:
+                    respostas[linha].append(token_id)
+                    if limites[linha] > passo + 1:
+                        restantes.append(posicao)
+                        continue
+                if ao_terminar is not None:
+                    ao_terminar(linha, respostas[linha])
+            if inst is not None:
+                inst.fase("softmax", inicio)
+            if len(restantes) < len(ativos):
+                ativos = [ativos[p] for p in restantes]
+                current = [current[p] for p in restantes]
+        return respostas
+
+    def gerar_resposta(self, prompt_tokens, max_steps, mostrar_tokens_atencao=False, 
+                      tokenizer=None, prompt_text="", penalidade_repeticao=0.7):
+        if mostrar_tokens_atencao and tokenizer is None:
+            raise Exception("Tokenizador não fornecido.")
+
+        cache = None if mostrar_tokens_atencao else self._cache_ativo()
+        if cache is not None:
+            chave = self._chave_cache("gerar", tuple(prompt_tokens), max_steps, penalidade_repeticao,
+                                      len(tokenizer.vocab))
+            resposta = cache.obter(chave)
+            if resposta is AUSENTE:
+                with self._reproduzivel():
+                    resposta = tuple(self.gerar_resposta_stream(prompt_tokens, max_steps, tokenizer=tokenizer,
+                                                                penalidade_repeticao=penalidade_repeticao))
+                cache.guardar(chave, resposta)
+            return list(resposta)
+
+        resposta = []
+        tokens_atencao = []
+        passos = self.gerar_resposta_stream(prompt_tokens, max_steps, tokenizer=tokenizer,
+                                            penalidade_repeticao=penalidade_repeticao,
+                                            top_k=5 if mostrar_tokens_atencao else 0)
+        for step, item in enumerate(passos):
+            if not mostrar_tokens_atencao:
+                resposta.append(item)
+                continue
+
+            # Exibe informações de debug
+            token_id, top5 = item
             resposta.append(token_id)
-            
-            # Exibe informações de debug se necessário
-            if mostrar_tokens_atencao:
-                if tokenizer is None:
-                    raise Exception("Tokenizador não fornecido.")
-                
-                # Prepara top 5
-                top5 = sorted(enumerate(probs), key=lambda x: x[1], reverse=True)[:5]
-                
-                print(f"\nPasso {step+1}:")
-                print("Top 5 tokens:")
-                for idx, prob in top5:
-                    token = tokenizer.vocab[idx] if idx < len(tokenizer.vocab) else f"[{idx}]"
-                    rep_flag = "(!REPETIDO!)" if idx in generated_token_ids else ""
-                    print(f"'{token}' {rep_flag}: {prob*100:.2f}%")
-                
-                chosen_token = tokenizer.vocab[token_id] if token_id < len(tokenizer.vocab) else f"[{token_id}]"
-                print(f"\nToken escolhido: {chosen_token}")
-                print("="*50)
-                time.sleep(1)
+            print(f"\nPasso {step+1}:")
+            print("Top 5 tokens:")
+            for idx, prob in top5:
+                token = tokenizer.vocab[idx] if idx < len(tokenizer.vocab) else f"[{idx}]"
+                rep_flag = "(!REPETIDO!)" if idx in resposta else ""
+                print(f"'{token}' {rep_flag}: {prob*100:.2f}%")
+
+            chosen_token = tokenizer.vocab[token_id] if token_id < len(tokenizer.vocab) else f"[{token_id}]"
+            print(f"\nToken escolhido: {chosen_token}")
+            print("="*50)
 
         if mostrar_tokens_atencao:
             return resposta, tokens_atencao
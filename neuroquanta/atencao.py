@@ -0,0 +1,245 @@
+import math
+from bisect import bisect_left, bisect_right
+from operator import mul
+from .backend import np
+
+# Self-attention Gaussiana unidimensional usada pelo CosmicResonanceModulator:
+#   saida_i = sum_j w_ij * t_j / sum_j w_ij,  com  w_ij = exp(-(t_i - t_j) ** 2)
+#
+# atencao_exata reproduz a soma completa O(n²) (em blocos vetorizados com NumPy).
+# atencao_rapida ordena as ativações, agrupa-as em faixas estreitas (substituindo cada faixa
+# pelo seu centroide) e só soma as faixas dentro de um raio de corte do kernel, custando
+# O(n log n + n * faixas_no_raio). Para cada saída calcula-se um limite rigoroso do erro em
+# relação à soma exata; as saídas cujo limite passa da tolerância são recalculadas exatamente.
+
+# Maior valor de |w''| e |w'| para w(d) = exp(-d²)
+_W2_MAX = 2.0
+_W1_MAX = math.sqrt(2 / math.e)
+
+# Número aproximado de elementos por bloco nas matrizes temporárias do NumPy
+_ELEMENTOS_POR_BLOCO = 1 << 20
+
+
+def atencao_exata(valores):
+    """
+    Uma camada de atenção Gaussiana exata. Aceita uma lista ou um vetor NumPy e retorna
+    o mesmo tipo.
+    """
+    if np is not None and isinstance(valores, np.ndarray):
+        t = valores
+        n = len(t)
+        passo = max(1, _ELEMENTOS_POR_BLOCO // max(n, 1))
+        resultado = np.empty(n)
+        for i in range(0, n, passo):
+            pesos = np.exp(-((t[i:i + passo, None] - t[None, :]) ** 2))
+            resultado[i:i + passo] = (pesos @ t) / pesos.sum(axis=1)
+        return resultado
+    exp = math.exp
+    resultado = []
+    for ti in valores:
+        pesos = [exp(-((ti - tj) ** 2)) for tj in valores]
+        resultado.append(sum(map(mul, pesos, valores)) / sum(pesos))
+    return resultado
+
+
+def retropropagar_atencao(valores, deltas):
+    """
+    Produto dos deltas em relação à saída de uma camada de atenção exata pela sua Jacobiana,
+    dados os valores de entrada da camada. Com P_ij = w_ij / sum_j w_ij e saida_i = sum_j P_ij t_j:
+        d saida_i / d t_k = M_ik + [i == k] * (1 - sum_j M_ij),
+        M_ik = P_ik * (1 + 2 * (t_i - t_k) * (t_k - saida_i)).
+    Retorna os deltas em relação às entradas, no mesmo tipo de `valores`. Com NumPy, `valores`
+    e `deltas` podem ser matrizes (uma linha por exemplo).
+    """
+    if np is not None and isinstance(valores, np.ndarray):
+        if valores.ndim == 2:
+            return _retropropagar_atencao_lote(valores, np.asarray(deltas, dtype=np.float64))
+        t = valores
+        g = np.asarray(deltas, dtype=np.float64)
+        n = len(t)
+        passo = max(1, _ELEMENTOS_POR_BLOCO // max(n, 1))
+        resultado = np.zeros(n)
+        for i in range(0, n, passo):
+            ti = t[i:i + passo, None]
+            pesos = np.exp(-((ti - t[None, :]) ** 2))
+            p = pesos / pesos.sum(axis=1, keepdims=True)
+            saidas = p @ t
+            m = p * (1 + 2 * (ti - t[None, :]) * (t[None, :] - saidas[:, None]))
+            gi = g[i:i + passo]
+            resultado += gi @ m
+            resultado[i:i + passo] += gi * (1 - m.sum(axis=1))
+        return resultado
+    exp = math.exp
+    n = len(valores)
+    resultado = [0.0] * n
+    for i, ti in enumerate(valores):
+        gi = deltas[i]
+        if not gi:
+            continue
+        pesos = [exp(-((ti - tj) ** 2)) for tj in valores]
+        total = sum(pesos)
+        saida = sum(map(mul, pesos, valores)) / total
+        soma_m = 0.0
+        for k, tk in enumerate(valores):
+            m = pesos[k] / total * (1 + 2 * (ti - tk) * (tk - saida))
+            soma_m += m
+            resultado[k] += gi * m
+        resultado[i] += gi * (1 - soma_m)
+    return resultado
+
+
+def _retropropagar_atencao_lote(t, g):
+    # Várias linhas por bloco (tensores lote x n x n), para linhas curtas em lotes grandes
+    lote, n = t.shape
+    passo = _ELEMENTOS_POR_BLOCO // max(n * n, 1)
+    if passo < 2:
+        return np.array([retropropagar_atencao(linha, delta) for linha, delta in zip(t, g)])
+    resultado = np.empty((lote, n))
+    for i in range(0, lote, passo):
+        tb = t[i:i + passo]
+        diferencas = tb[:, :, None] - tb[:, None, :]
+        pesos = np.exp(-(diferencas ** 2))
+        p = pesos / pesos.sum(axis=2, keepdims=True)
+        saidas = np.einsum("lij,lj->li", p, tb)
+        m = p * (1 + 2 * diferencas * (tb[:, None, :] - saidas[:, :, None]))
+        gb = g[i:i + passo]
+        resultado[i:i + passo] = np.einsum("li,lik->lk", gb, m) + gb * (1 - m.sum(axis=2))
+    return resultado
+
+
+def _parametros(n, maior, tolerancia, corte):
+    # Largura das faixas: o erro do centroide cresce com largura², ponderado por |t|
+    largura = math.sqrt(tolerancia / (2 * maior + _W1_MAX))
+    if corte is None:
+        # Raio em que a massa descartada de n fontes, ponderada por |t|, fica abaixo de tol/2
+        corte = math.sqrt(max(math.log(4 * n * (maior + 1) / tolerancia), 1.0)) + largura
+    return largura, corte
+
+
+def _faixas(ordenados, largura):
+    # Agrupa valores ordenados em faixas [inicio, inicio + largura) e devolve, para cada
+    # faixa, o centroide, a contagem e a soma dos quadrados dos desvios ao centroide
+    centroides, contagens, dispersoes = [], [], []
+    i = 0
+    n = len(ordenados)
+    while i < n:
+        limite = ordenados[i] + largura
+        j = bisect_left(ordenados, limite, i + 1)
+        grupo = ordenados[i:j]
+        c = sum(grupo) / len(grupo)
+        centroides.append(c)
+        contagens.append(len(grupo))
+        dispersoes.append(sum((v - c) ** 2 for v in grupo))
+        i = j
+    return centroides, contagens, dispersoes
+
+
+def atencao_rapida(valores, tolerancia=1e-4, corte=None):
+    """
+    Uma camada de atenção Gaussiana aproximada, com erro absoluto por elemento limitado
+    por `tolerancia` em relação a atencao_exata. `corte` fixa o raio do kernel (em unidades
+    de ativação); por padrão ele é derivado da tolerância e do tamanho da entrada.
+    """
+    usar_numpy = np is not None and isinstance(valores, np.ndarray)
+    n = len(valores)
+    if n == 0:
+        return valores
+    maior = float(max(abs(min(valores)), abs(max(valores))))
+    largura, corte = _parametros(n, maior, tolerancia, corte)
+    cauda = math.exp(-max(corte - largura, 0.0) ** 2)
+    fator_n = _W2_MAX / 2 * maior + _W1_MAX
+
+    if usar_numpy:
+        return _atencao_rapida_numpy(valores, tolerancia, largura, corte, cauda, fator_n, maior)
+
+    ordenados = sorted(valores)
+    centroides, contagens, dispersoes = _faixas(ordenados, largura)
+    # Somas acumuladas para obter contagem e dispersão de uma janela em O(1)
+    acum_contagem = [0]
+    acum_dispersao = [0.0]
+    for cnt, disp in zip(contagens, dispersoes):
+        acum_contagem.append(acum_contagem[-1] + cnt)
+        acum_dispersao.append(acum_dispersao[-1] + disp)
+    exp = math.exp
+    resultado = []
+    for ti in valores:
+        a = bisect_left(centroides, ti - corte)
+        b = bisect_right(centroides, ti + corte)
+        soma_d = 0.0
+        soma_n = 0.0
+        for k in range(a, b):
+            c = centroides[k]
+            w = contagens[k] * exp(-((ti - c) ** 2))
+            soma_d += w
+            soma_n += w * c
+        fora = n - (acum_contagem[b] - acum_contagem[a])
+        dispersao = acum_dispersao[b] - acum_dispersao[a]
+        erro_d = _W2_MAX / 2 * dispersao + fora * cauda
+        erro_n = fator_n * dispersao + maior * fora * cauda
+        if soma_d > 0 and (erro_n + maior * erro_d) / soma_d <= tolerancia:
+            resultado.append(soma_n / soma_d)
+        else:
+            pesos = [exp(-((ti - tj) ** 2)) for tj in valores]
+            resultado.append(sum(map(mul, pesos, valores)) / sum(pesos))
+    return resultado
+
+
+def _atencao_rapida_numpy(t, tolerancia, largura, corte, cauda, fator_n, maior):
+    n = len(t)
+    ordem = np.argsort(t, kind="stable")
+    ordenados = t[ordem]
+    # Faixas de largura fixa a partir do menor valor
+    rotulos = np.floor((ordenados - ordenados[0]) / largura).astype(np.int64)
+    inicios = np.flatnonzero(np.r_[True, rotulos[1:] != rotulos[:-1]])
+    contagens = np.diff(np.r_[inicios, n]).astype(np.float64)
+    somas = np.add.reduceat(ordenados, inicios)
+    centroides = somas / contagens
+    desvios = ordenados - np.repeat(centroides, np.diff(np.r_[inicios, n]))
+    dispersoes = np.add.reduceat(desvios ** 2, inicios)
+    acum_contagem = np.r_[0.0, np.cumsum(contagens)]
+    acum_dispersao = np.r_[0.0, np.cumsum(dispersoes)]
+
+    resultado_ordenado = np.empty(n)
+    faixas = len(centroides)
+    passo = max(1, _ELEMENTOS_POR_BLOCO // max(faixas, 1))
+    for i in range(0, n, passo):
+        alvos = ordenados[i:i + passo]
+        # Janela de faixas que cobre todo o bloco de alvos (ordenados) mais o raio de corte
+        a = int(np.searchsorted(centroides, alvos[0] - corte, side="left"))
+        b = int(np.searchsorted(centroides, alvos[-1] + corte, side="right"))
+        c = centroides[a:b]
+        dist = alvos[:, None] - c[None, :]
+        pesos = contagens[a:b] * np.exp(-(dist ** 2))
+        pesos[np.abs(dist) > corte] = 0.0
+        soma_d = pesos.sum(axis=1)
+        soma_n = pesos @ c
+        # Limites por alvo: faixas dentro do raio individual de cada alvo
+        lo = np.searchsorted(centroides, alvos - corte, side="left")
+        hi = np.searchsorted(centroides, alvos + corte, side="right")
+        fora = n - (acum_contagem[hi] - acum_contagem[lo])
+        dispersao = acum_dispersao[hi] - acum_dispersao[lo]
+        erro_d = _W2_MAX / 2 * dispersao + fora * cauda
+        erro_n = fator_n * dispersao + maior * fora * cauda
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bloco = soma_n / soma_d
+            limite = (erro_n + maior * erro_d) / soma_d
+        ruins = ~(limite <= tolerancia)
+        if ruins.any():
+            # Recalcula exatamente os alvos cujo limite de erro passou da tolerância
+            bloco[ruins] = atencao_exata_para(alvos[ruins], t)
+        resultado_ordenado[i:i + passo] = bloco
+    resultado = np.empty(n)
+    resultado[ordem] = resultado_ordenado
+    return resultado
+
+
+def atencao_exata_para(alvos, fontes):
+    """
+    Atenção exata para um subconjunto de alvos sobre todas as fontes (NumPy).
+    """
+    passo = max(1, _ELEMENTOS_POR_BLOCO // max(len(fontes), 1))
+    resultado = np.empty(len(alvos))
+    for i in range(0, len(alvos), passo):
+        pesos = np.exp(-((alvos[i:i + passo, None] - fontes[None, :]) ** 2))
+        resultado[i:i + passo] = (pesos @ fontes) / pesos.sum(axis=1)
+    return resultado
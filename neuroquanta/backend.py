@@ -0,0 +1,60 @@
+import os
+from array import array
+
+# NumPy é opcional: quando instalado, as camadas guardam seus parâmetros em ndarrays
+# e o passo para frente vira um único produto matriz-vetor. Sem NumPy, usa-se array('d').
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depende do ambiente
+    np = None
+
+BACKENDS = ("array", "numpy")
+
+# Backend usado quando nenhum é informado; pode ser forçado com NEUROQUANTA_BACKEND=array
+PADRAO = os.environ.get("NEUROQUANTA_BACKEND") or ("numpy" if np is not None else "array")
+
+
+def resolver_backend(nome=None):
+    """
+    Retorna o nome do backend a ser usado, validando a disponibilidade do NumPy.
+    """
+    nome = nome or PADRAO
+    if nome not in BACKENDS:
+        raise ValueError(f"Backend desconhecido: {nome!r}. Use um de {BACKENDS}.")
+    if nome == "numpy" and np is None:
+        raise ValueError("Backend 'numpy' solicitado, mas o NumPy não está instalado.")
+    return nome
+
+
+def vetor(valores, backend):
+    """
+    Cria um vetor contíguo de floats (float64) no backend informado.
+    """
+    if backend == "numpy":
+        return np.array(valores, dtype=np.float64)
+    if isinstance(valores, (bytes, bytearray, memoryview)):
+        v = array("d")
+        v.frombytes(valores)
+        return v
+    return array("d", valores)
+
+
+def zeros(n, backend):
+    """
+    Cria um vetor de n zeros no backend informado.
+    """
+    if backend == "numpy":
+        return np.zeros(n, dtype=np.float64)
+    return array("d", bytes(8 * n))
+
+
+def para_array(valores):
+    """
+    Converte qualquer vetor de parâmetros (array, memoryview ou ndarray) para array('d'),
+    o formato portátil usado na serialização.
+    """
+    if np is not None and isinstance(valores, np.ndarray):
+        return vetor(np.ascontiguousarray(valores, dtype=np.float64).tobytes(), "array")
+    if isinstance(valores, memoryview):
+        return vetor(valores.tobytes(), "array")
+    return array("d", valores)
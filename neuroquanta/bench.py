@@ -0,0 +1,309 @@
+"""
+Benchmarks dos caminhos críticos do NeuroQuanta.
+
+Uso:
+    python -m neuroquanta.bench --saida resultados.json
+    python -m neuroquanta.bench --comparar base.json --limiar 0.15
+    python -m neuroquanta.bench --larguras 64,256 --vocabs 1000 --lotes 1,32 --filtro transform
+
+Cada caso roda sobre a grade de larguras de camada, tamanhos de vocabulário e tamanhos de lote
+que usa, com sementes fixas. O resultado (melhor tempo por chamada, em segundos) vai para JSON;
+--comparar aponta as regressões em relação a um arquivo de resultados anterior e termina com
+código 1 se houver alguma.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from . import NeuroQuantaNetwork, Camada, CosmicResonanceModulator, Tokenizer
+from .backend import PADRAO, np
+
+# Duração mínima de cada medição; chamadas rápidas são repetidas até atingi-la
+DURACAO_MINIMA = 0.05
+
+
+def _palavras(vocab, semente):
+    rng = random.Random(semente)
+    return [f"p{rng.randrange(10 ** 6)}x{i}" for i in range(vocab)]
+
+
+def _textos(vocab, quantidade, semente):
+    palavras = _palavras(vocab, semente)
+    rng = random.Random(semente + 1)
+    # Primeiro garante que todas as palavras aparecem, depois frases aleatórias
+    textos = [" ".join(palavras[i:i + 8]) + "." for i in range(0, vocab, 8)]
+    textos += [" ".join(rng.choice(palavras) for _ in range(rng.randint(3, 12))) + "!" for _ in range(quantidade)]
+    return textos
+
+
+def _rede(entrada, oculto, saida, atencao=False, modo_atencao='exato'):
+    rede = NeuroQuantaNetwork(entrada, oculto, saida)
+    rede.integrar_transformer(CosmicResonanceModulator(tem_atencao=atencao, modo_atencao=modo_atencao))
+    return rede
+
+
+def _vetor(n, semente):
+    rng = random.Random(semente)
+    return [rng.uniform(-1, 1) for _ in range(n)]
+
+
+# Cada caso recebe os parâmetros da grade e retorna a função a ser medida
+def caso_camada_frente(largura):
+    camada = Camada(largura, largura)
+    x = _vetor(largura, 1)
+    return lambda: camada.frente(x)
+
+
+def caso_prever(largura):
+    rede = _rede(largura, largura, largura)
+    x = _vetor(largura, 1)
+    return lambda: rede.prever(x)
+
+
+def caso_prever_lote(largura, lote):
+    rede = _rede(largura, largura, largura)
+    xs = [_vetor(largura, i) for i in range(lote)]
+    return lambda: rede.prever_lote(xs)
+
+
+def caso_transform(vocab):
+    modulador = CosmicResonanceModulator()
+    x = _vetor(vocab, 1)
+    return lambda: modulador.transform(x)
+
+
+def caso_transform_atencao(vocab):
+    modulador = CosmicResonanceModulator(tem_atencao=True)
+    x = _vetor(vocab, 1)
+    return lambda: modulador.transform(x)
+
+
+def caso_transform_atencao_rapida(vocab):
+    modulador = CosmicResonanceModulator(tem_atencao=True, modo_atencao='rapido')
+    x = _vetor(vocab, 1)
+    return lambda: modulador.transform(x)
+
+
+def caso_tokenizer_adicionar(vocab):
+    textos = _textos(vocab, 4 * vocab, 1)
+
+    def executar():
+        Tokenizer(minusculas=True).adicionar(textos)
+    return executar
+
+
+def caso_tokenizer_tokenizar(vocab):
+    textos = _textos(vocab, 4 * vocab, 1)
+    tokenizer = Tokenizer(minusculas=True)
+    tokenizer.adicionar(textos)
+    amostra = textos[-200:]
+
+    def executar():
+        for texto in amostra:
+            tokenizer.tokenizar(texto)
+    return executar
+
+
+def caso_melhorar_modelo(largura):
+    rede = _rede(largura, largura, largura)
+
+    def executar():
+        with contextlib.redirect_stdout(io.StringIO()):
+            rede.melhorar_modelo(epocas=100, taxa_aprendizado=1e-6)
+    return executar
+
+
+def caso_gerar_resposta(vocab, atencao=False, modo_atencao='exato'):
+    rede = _rede(4, 4, 4, atencao, modo_atencao)
+    tokenizer = Tokenizer()
+    tokenizer.vocab = ["<PAD>"] + _palavras(vocab - 1, 2)
+    return lambda: rede.gerar_resposta([1, 2, 3], max_steps=5, tokenizer=tokenizer)
+
+
+# Com atenção, cada passo da geração soma os pares de um vetor do tamanho do vocabulário
+def caso_gerar_resposta_atencao(vocab):
+    return caso_gerar_resposta(vocab, atencao=True)
+
+
+def caso_gerar_resposta_atencao_rapida(vocab):
+    return caso_gerar_resposta(vocab, atencao=True, modo_atencao='rapido')
+
+
+def caso_gerar_resposta_lote(vocab, lote, atencao=False, modo_atencao='exato'):
+    rede = _rede(4, 4, 4, atencao, modo_atencao)
+    prompts = [[1 + (i + j) % (vocab - 1) for j in range(3)] for i in range(lote)]
+    return lambda: rede.gerar_resposta_lote(prompts, max_steps=5, tamanho_vocab=vocab)
+
+
+def caso_gerar_resposta_lote_atencao(vocab, lote):
+    return caso_gerar_resposta_lote(vocab, lote, atencao=True)
+
+
+def caso_gerar_resposta_lote_atencao_rapida(vocab, lote):
+    return caso_gerar_resposta_lote(vocab, lote, atencao=True, modo_atencao='rapido')
+
+
+@contextlib.contextmanager
+def caso_salvar_carregar(largura):
+    # Gerenciador de contexto: a pasta temporária é removida quando o caso termina
+    rede = _rede(largura, largura, largura)
+    with tempfile.TemporaryDirectory(prefix="nqn_bench_") as pasta:
+        nome = os.path.join(pasta, "modelo")
+
+        def executar():
+            with contextlib.redirect_stdout(io.StringIO()):
+                rede.salvar_modelo(nome)
+                NeuroQuantaNetwork.carregar_modelo(nome)
+        yield executar
+
+
+# nome -> (função, eixos da grade usados). A função retorna o que será medido, ou um gerenciador
+# de contexto que o fornece e libera os recursos do caso ao final
+CASOS = {
+    "camada.frente": (caso_camada_frente, ("largura",)),
+    "prever": (caso_prever, ("largura",)),
+    "prever_lote": (caso_prever_lote, ("largura", "lote")),
+    "transform": (caso_transform, ("vocab",)),
+    "transform.atencao": (caso_transform_atencao, ("vocab",)),
+    "transform.atencao_rapida": (caso_transform_atencao_rapida, ("vocab",)),
+    "tokenizer.adicionar": (caso_tokenizer_adicionar, ("vocab",)),
+    "tokenizer.tokenizar": (caso_tokenizer_tokenizar, ("vocab",)),
+    "melhorar_modelo": (caso_melhorar_modelo, ("largura",)),
+    "gerar_resposta": (caso_gerar_resposta, ("vocab",)),
+    "gerar_resposta.atencao": (caso_gerar_resposta_atencao, ("vocab",)),
+    "gerar_resposta.atencao_rapida": (caso_gerar_resposta_atencao_rapida, ("vocab",)),
+    "gerar_resposta_lote": (caso_gerar_resposta_lote, ("vocab", "lote")),
+    "gerar_resposta_lote.atencao": (caso_gerar_resposta_lote_atencao, ("vocab", "lote")),
+    "gerar_resposta_lote.atencao_rapida": (caso_gerar_resposta_lote_atencao_rapida, ("vocab", "lote")),
+    "salvar_carregar": (caso_salvar_carregar, ("largura",)),
+}
+
+
+def _grade(eixos, valores):
+    combinacoes = [{}]
+    for eixo in eixos:
+        combinacoes = [dict(c, **{eixo: v}) for c in combinacoes for v in valores[eixo]]
+    return combinacoes
+
+
+def medir(funcao, repeticoes=3, semente=0):
+    """
+    Mede a função e retorna (melhor, mediana) do tempo por chamada, em segundos.
+    Cada medição repete a chamada até durar pelo menos DURACAO_MINIMA.
+    """
+    random.seed(semente)
+    inicio = time.perf_counter()
+    funcao()
+    duracao = time.perf_counter() - inicio
+    chamadas = max(1, int(DURACAO_MINIMA / duracao)) if duracao > 0 else 1000
+    tempos = []
+    for _ in range(repeticoes):
+        random.seed(semente)
+        inicio = time.perf_counter()
+        for _ in range(chamadas):
+            funcao()
+        tempos.append((time.perf_counter() - inicio) / chamadas)
+    return min(tempos), statistics.median(tempos)
+
+
+def executar(larguras, vocabs, lotes, repeticoes=3, filtro=None, semente=0, saida=sys.stdout):
+    """
+    Roda os casos selecionados sobre a grade e retorna o dicionário de resultados.
+    """
+    valores = {"largura": larguras, "vocab": vocabs, "lote": lotes}
+    resultados = []
+    for nome, (caso, eixos) in CASOS.items():
+        if filtro and filtro not in nome:
+            continue
+        for parametros in _grade(eixos, valores):
+            random.seed(semente)
+            with contextlib.ExitStack() as recursos:
+                funcao = caso(**parametros)
+                if hasattr(funcao, "__enter__"):
+                    funcao = recursos.enter_context(funcao)
+                melhor, mediana = medir(funcao, repeticoes, semente)
+            resultados.append({"nome": nome, "parametros": parametros, "segundos": melhor, "mediana": mediana})
+            descricao = " ".join(f"{k}={v}" for k, v in parametros.items())
+            print(f"{nome:<36} {descricao:<24} {melhor * 1e3:12.4f} ms", file=saida)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "backend": PADRAO,
+            "numpy": np.__version__ if np is not None else None,
+            "semente": semente,
+            "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "resultados": resultados,
+    }
+
+
+def _chave(resultado):
+    return resultado["nome"], tuple(sorted(resultado["parametros"].items()))
+
+
+def comparar(base, atual, limiar=0.15, saida=sys.stdout):
+    """
+    Compara dois conjuntos de resultados e retorna a lista de regressões: casos cujo tempo
+    cresceu mais que `limiar` (fração) em relação à base.
+    """
+    anteriores = {_chave(r): r for r in base["resultados"]}
+    regressoes = []
+    for resultado in atual["resultados"]:
+        anterior = anteriores.get(_chave(resultado))
+        if anterior is None or anterior["segundos"] <= 0:
+            continue
+        razao = resultado["segundos"] / anterior["segundos"]
+        marca = ""
+        if razao > 1 + limiar:
+            marca = "REGRESSÃO"
+            regressoes.append(dict(resultado, razao=razao))
+        elif razao < 1 / (1 + limiar):
+            marca = "melhora"
+        descricao = " ".join(f"{k}={v}" for k, v in resultado["parametros"].items())
+        print(f"{resultado['nome']:<36} {descricao:<24} {razao:8.2f}x {marca}", file=saida)
+    return regressoes
+
+
+def _inteiros(texto):
+    return [int(v) for v in texto.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m neuroquanta.bench", description="Benchmarks do NeuroQuanta.")
+    parser.add_argument("--larguras", type=_inteiros, default=[32, 128], help="larguras de camada (ex.: 32,128)")
+    parser.add_argument("--vocabs", type=_inteiros, default=[200, 2000], help="tamanhos de vocabulário")
+    parser.add_argument("--lotes", type=_inteiros, default=[1, 16], help="tamanhos de lote")
+    parser.add_argument("--repeticoes", type=int, default=3, help="medições por caso")
+    parser.add_argument("--semente", type=int, default=0, help="semente dos geradores aleatórios")
+    parser.add_argument("--filtro", help="roda apenas casos cujo nome contém este texto")
+    parser.add_argument("--saida", help="grava os resultados neste arquivo JSON")
+    parser.add_argument("--comparar", help="arquivo JSON de resultados base para detectar regressões")
+    parser.add_argument("--limiar", type=float, default=0.15, help="aumento relativo que conta como regressão")
+    args = parser.parse_args(argv)
+
+    resultados = executar(args.larguras, args.vocabs, args.lotes, args.repeticoes, args.filtro, args.semente)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        print()
+        regressoes = comparar(base, resultados, args.limiar)
+        if regressoes:
+            print(f"\n{len(regressoes)} regressão(ões) acima de {args.limiar:.0%}.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
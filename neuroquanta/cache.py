@@ -0,0 +1,60 @@
+from collections import OrderedDict
+
+# Marca de ausência em CacheLRU.obter (None pode ser um valor guardado)
+AUSENTE = object()
+
+
+class CacheLRU:
+    """
+    Cache limitado a `capacidade` itens, descartando o usado há mais tempo.
+    Guarda também a versão dos dados de origem: validar(versao) esvazia o cache quando a versão
+    muda, de modo que resultados calculados com parâmetros antigos nunca são devolvidos.
+    """
+
+    def __init__(self, capacidade=1024):
+        if capacidade <= 0:
+            raise ValueError("capacidade deve ser positiva.")
+        self.capacidade = capacidade
+        self.itens = OrderedDict()
+        self.versao = None
+        self.acertos = 0
+        self.falhas = 0
+        self.invalidacoes = 0
+
+    def validar(self, versao):
+        if versao != self.versao:
+            if self.itens:
+                self.invalidacoes += 1
+                self.itens.clear()
+            self.versao = versao
+
+    def obter(self, chave):
+        """
+        Valor guardado para a chave, ou AUSENTE.
+        """
+        valor = self.itens.get(chave, AUSENTE)
+        if valor is AUSENTE:
+            self.falhas += 1
+        else:
+            self.acertos += 1
+            self.itens.move_to_end(chave)
+        return valor
+
+    def guardar(self, chave, valor):
+        self.itens[chave] = valor
+        self.itens.move_to_end(chave)
+        if len(self.itens) > self.capacidade:
+            self.itens.popitem(last=False)
+
+    def limpar(self):
+        self.itens.clear()
+
+    def estatisticas(self):
+        """
+        Acertos, falhas, taxa de acertos, invalidações e ocupação do cache.
+        """
+        consultas = self.acertos + self.falhas
+        return {"acertos": self.acertos, "falhas": self.falhas,
+                "taxa_acertos": self.acertos / consultas if consultas else 0.0,
+                "invalidacoes": self.invalidacoes, "tamanho": len(self.itens),
+                "capacidade": self.capacidade}
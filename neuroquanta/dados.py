@@ -0,0 +1,188 @@
+import json
+import random
+import threading
+from queue import Queue, Empty, Full
+
+# Carregamento de dados em fluxo: os pares (prompt, resposta) são lidos do arquivo, embaralhados
+# em um buffer limitado e tokenizados sob demanda, de modo que a memória usada não cresce com o
+# tamanho do corpus. Um ConjuntoDados pode ser percorrido várias vezes (uma por época de treinar).
+
+# Marca de fim do fluxo na fila de pre_carregar
+_FIM = object()
+
+
+def embaralhar(iteravel, tamanho_buffer, rng=None):
+    """
+    Embaralhamento aproximado em fluxo: mantém até `tamanho_buffer` itens e, a cada novo item
+    lido, devolve um sorteado do buffer. Com um buffer maior que o corpus, equivale a
+    random.shuffle; com tamanho_buffer <= 1, preserva a ordem. Sem `rng`, a semente vem do
+    gerador global `random`, de modo que um random.seed anterior torna a ordem reprodutível.
+    """
+    rng = rng if rng is not None else random.Random(random.getrandbits(64))
+    if tamanho_buffer <= 1:
+        yield from iteravel
+        return
+    buffer = []
+    for item in iteravel:
+        if len(buffer) < tamanho_buffer:
+            buffer.append(item)
+            continue
+        i = rng.randrange(tamanho_buffer)
+        yield buffer[i]
+        buffer[i] = item
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+def pre_carregar(iteravel, tamanho_fila=64):
+    """
+    Percorre o iterável em uma thread em segundo plano, mantendo até `tamanho_fila` itens prontos,
+    para que leitura e tokenização se sobreponham ao treino. Exceções da thread são relançadas no
+    consumidor; se o consumidor parar antes do fim, a thread é encerrada.
+    """
+    fila = Queue(maxsize=max(1, tamanho_fila))
+    parar = threading.Event()
+
+    def entregar(item):
+        # put com tempo limite, para notar quando o consumidor desistiu
+        while not parar.is_set():
+            try:
+                fila.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produzir():
+        try:
+            for item in iteravel:
+                if not entregar(item):
+                    return
+        except BaseException as erro:
+            entregar((_FIM, erro))
+            return
+        entregar((_FIM, None))
+
+    thread = threading.Thread(target=produzir, name="neuroquanta-pre-carregar", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = fila.get()
+            if type(item) is tuple and len(item) == 2 and item[0] is _FIM:
+                if item[1] is not None:
+                    raise item[1]
+                return
+            yield item
+    finally:
+        parar.set()
+        # Esvazia a fila para liberar um put pendente
+        try:
+            while True:
+                fila.get_nowait()
+        except Empty:
+            pass
+        thread.join()
+
+
+class ConjuntoDados:
+    """
+    Pares (prompt, resposta) de um arquivo JSONL ou texto, tokenizados sob demanda.
+
+    - JSONL (extensão .jsonl/.json ou formato='jsonl'): um objeto por linha com as chaves
+      `campos` (por padrão "prompt" e "resposta") ou uma lista [prompt, resposta].
+    - Texto: uma linha "prompt<separador>resposta" por par (separador padrão: tabulação).
+
+    Linhas em branco são ignoradas. Cada iteração relê o arquivo, passa os pares por um buffer
+    de embaralhamento de `buffer_embaralhamento` itens (0 preserva a ordem) e os tokeniza com
+    tokenizer.tokenizar_lote (com esparso=True, a entrada usa tokenizar_esparso). Com pre_carregar > 0,
+    leitura e tokenização rodam em uma thread que mantém até esse número de pares prontos.
+    Com semente, a ordem de cada época é reprodutível (e diferente entre épocas); sem ela, a
+    ordem segue o gerador global `random` (random.seed a torna reprodutível).
+
+    O vocabulário precisa existir antes do treino: tokenizer.adicionar(conjunto.textos())
+    o constrói em uma passada pelo arquivo, também sem materializar o corpus.
+    """
+
+    def __init__(self, caminho, tokenizer, formato=None, campos=("prompt", "resposta"), separador="\t",
+                 buffer_embaralhamento=0, semente=None, pre_carregar=0, esparso=False, encoding="utf-8"):
+        if formato is None:
+            formato = "jsonl" if str(caminho).lower().endswith((".jsonl", ".json")) else "texto"
+        if formato not in ("jsonl", "texto"):
+            raise ValueError(f"formato deve ser 'jsonl' ou 'texto', recebido {formato!r}.")
+        self.caminho = caminho
+        self.tokenizer = tokenizer
+        self.formato = formato
+        self.campos = tuple(campos)
+        self.separador = separador
+        self.buffer_embaralhamento = buffer_embaralhamento
+        self.semente = semente
+        self.pre_carregar = pre_carregar
+        self.esparso = esparso
+        self.encoding = encoding
+        self.epoca = 0
+
+    def pares_texto(self):
+        """
+        Gera os pares (prompt, resposta) do arquivo, na ordem em que aparecem.
+        """
+        with open(self.caminho, encoding=self.encoding) as f:
+            for numero, linha in enumerate(f, 1):
+                linha = linha.rstrip("\r\n")
+                if not linha.strip():
+                    continue
+                yield self._interpretar(linha, numero)
+
+    def _interpretar(self, linha, numero):
+        if self.formato == "texto":
+            partes = linha.split(self.separador, 1)
+            if len(partes) != 2:
+                raise ValueError(f"{self.caminho}:{numero}: linha sem o separador {self.separador!r}.")
+            return partes[0], partes[1]
+        try:
+            registro = json.loads(linha)
+        except ValueError as erro:
+            raise ValueError(f"{self.caminho}:{numero}: JSON inválido ({erro}).") from None
+        if isinstance(registro, dict):
+            try:
+                prompt, resposta = (registro[campo] for campo in self.campos)
+            except KeyError as erro:
+                raise ValueError(f"{self.caminho}:{numero}: campo {erro} ausente.") from None
+        elif isinstance(registro, list) and len(registro) == 2:
+            prompt, resposta = registro
+        else:
+            raise ValueError(f"{self.caminho}:{numero}: esperado um objeto ou uma lista [prompt, resposta].")
+        if not isinstance(prompt, str) or not isinstance(resposta, str):
+            raise ValueError(f"{self.caminho}:{numero}: prompt e resposta devem ser textos.")
+        return prompt, resposta
+
+    def textos(self):
+        """
+        Gera prompts e respostas como textos soltos, para tokenizer.adicionar.
+        """
+        for prompt, resposta in self.pares_texto():
+            yield prompt
+            yield resposta
+
+    def _tokenizar(self, pares):
+        tokenizer = self.tokenizer
+        if self.esparso:
+            # Só a entrada é esparsa: o alvo é comparado com a saída densa da rede
+            for prompt, resposta in pares:
+                yield tokenizer.tokenizar_esparso(prompt), tokenizer.tokenizar_lote((resposta,))[0]
+        else:
+            for prompt, resposta in pares:
+                entrada, saida = tokenizer.tokenizar_lote((prompt, resposta))
+                yield entrada, saida
+
+    def __iter__(self):
+        rng = None
+        if self.buffer_embaralhamento > 1:
+            # Uma semente derivada por época: ordem reprodutível, mas diferente a cada passada.
+            # Sem semente, ela vem do gerador global `random`
+            semente = random.getrandbits(64) if self.semente is None else f"{self.semente}:{self.epoca}"
+            rng = random.Random(semente)
+        self.epoca += 1
+        fluxo = self._tokenizar(embaralhar(self.pares_texto(), self.buffer_embaralhamento, rng))
+        if self.pre_carregar > 0:
+            fluxo = pre_carregar(fluxo, self.pre_carregar)
+        return iter(fluxo)
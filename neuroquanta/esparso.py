@@ -0,0 +1,78 @@
+from bisect import bisect_left
+
+# Entradas esparsas: sequências tokenizadas são quase só PAD (zeros) e o estado inicial da
+# geração é um one-hot do tamanho do vocabulário. Um VetorEsparso guarda apenas os pares
+# (índice, valor) não nulos, e as camadas e o modulador o processam somando só as colunas
+# tocadas, com custo proporcional ao número de não nulos e não ao tamanho denso.
+
+
+class VetorEsparso:
+    """
+    Vetor de tamanho `tamanho` em que só os pares (índice, valor) não nulos são guardados,
+    em ordem crescente de índice. Índices repetidos mantêm o último valor, como atribuições
+    em um vetor denso.
+    """
+
+    __slots__ = ("tamanho", "indices", "valores")
+
+    def __init__(self, pares, tamanho=None):
+        valores = {}
+        for indice, valor in pares:
+            indice = int(indice)
+            if indice < 0:
+                raise ValueError(f"Índice negativo em vetor esparso: {indice}.")
+            valores[indice] = float(valor)
+        itens = sorted((i, v) for i, v in valores.items() if v != 0)
+        self.indices = tuple(i for i, _ in itens)
+        self.valores = tuple(v for _, v in itens)
+        if tamanho is None:
+            tamanho = self.indices[-1] + 1 if self.indices else 0
+        elif self.indices and self.indices[-1] >= tamanho:
+            raise ValueError(f"Índice {self.indices[-1]} fora de um vetor de tamanho {tamanho}.")
+        self.tamanho = tamanho
+
+    @classmethod
+    def de_denso(cls, valores):
+        """
+        Versão esparsa de um vetor denso (ex.: uma sequência de Tokenizer.tokenizar).
+        """
+        return cls(((i, v) for i, v in enumerate(valores) if v), len(valores))
+
+    @classmethod
+    def one_hot(cls, ids, tamanho):
+        """
+        Vetor com 1.0 em cada id (ids fora do tamanho são ignorados), como o estado inicial
+        da geração a partir dos tokens do prompt.
+        """
+        return cls(((i, 1.0) for i in ids if i < tamanho), tamanho)
+
+    def recortar(self, n):
+        """
+        (indices, valores) restritos aos n primeiros elementos: como o zip das células, entradas
+        além do tamanho da camada são ignoradas.
+        """
+        if self.tamanho <= n or not self.indices or self.indices[-1] < n:
+            return self.indices, self.valores
+        fim = bisect_left(self.indices, n)
+        return self.indices[:fim], self.valores[:fim]
+
+    def para_denso(self):
+        denso = [0.0] * self.tamanho
+        for i, v in zip(self.indices, self.valores):
+            denso[i] = v
+        return denso
+
+    def __len__(self):
+        return self.tamanho
+
+    def __eq__(self, outro):
+        if not isinstance(outro, VetorEsparso):
+            return NotImplemented
+        return (self.tamanho, self.indices, self.valores) == (outro.tamanho, outro.indices, outro.valores)
+
+    def __hash__(self):
+        return hash((self.tamanho, self.indices, self.valores))
+
+    def __repr__(self):
+        pares = ", ".join(f"{i}: {v!r}" for i, v in zip(self.indices, self.valores))
+        return f"VetorEsparso({{{pares}}}, tamanho={self.tamanho})"
@@ -0,0 +1,152 @@
+import random
+from .backend import np
+from .formato import montar_rede
+from .paralelo import layout_parametros, visao_memoria, descricao_rede
+from .perturbacao import MotorPerturbacao
+
+# Busca evolutiva (estratégia de evolução) para melhorar_modelo.
+#
+# Cada geração sorteia uma população de candidatos em torno dos parâmetros atuais e mede o erro
+# de cada um em um lote de avaliação. Um candidato é descrito apenas por uma lista de pares
+# (semente, escala): o ruído é regenerado a partir da semente por MotorPerturbacao, então
+# só trafegam números entre os processos. Os parâmetros base ficam em memória compartilhada.
+# A geração mantém o melhor entre a base, o melhor candidato e a recombinação (média dos
+# ruídos) dos melhores candidatos.
+
+# Estado de cada processo avaliador, preenchido por _iniciar_avaliador
+_AVALIADOR = {}
+
+
+def _vetor_local(tamanho, backend):
+    # Vetor de trabalho que aceita cópia de qualquer vetor de parâmetros por atribuição de fatia
+    if backend == "numpy":
+        return np.zeros(tamanho)
+    return memoryview(bytearray(8 * tamanho)).cast("d")
+
+
+class _Avaliador:
+    """
+    Avalia candidatos sobre uma cópia local da rede, recomposta a partir dos vetores base.
+    """
+
+    def __init__(self, descricao, base, dados):
+        backend = descricao["backend"]
+        vetores = {}
+        self.locais = {}
+        for chave, _, tamanho in descricao["layout"]:
+            self.locais[chave] = vetores[chave] = _vetor_local(tamanho, backend)
+            vetores[chave + "_velocidade"] = _vetor_local(tamanho, backend)
+        self.rede = montar_rede(descricao["arquitetura"], descricao["camadas"], vetores, backend,
+                                descricao["transformer"])
+        self.base = base
+        self.dados = dados
+
+    def avaliar(self, candidato, semente_avaliacao):
+        for chave, destino in self.locais.items():
+            destino[:] = self.base[chave]
+        camadas = [self.rede.camada_oculta, self.rede.camada_saida]
+        for semente, escala in candidato:
+            MotorPerturbacao(semente).perturbar(camadas, escala)
+        # Todos os candidatos de uma geração veem o mesmo jitter do transformer
+        if self.rede.transformer is not None:
+            self.rede.transformer.semear(semente_avaliacao)
+        return self.rede.avaliar(self.dados)
+
+
+def _iniciar_avaliador(nome_memoria, descricao, dados):
+    from multiprocessing import shared_memory
+
+    memoria = shared_memory.SharedMemory(name=nome_memoria)
+    base = {chave: visao_memoria(memoria, deslocamento, tamanho, descricao["backend"])
+            for chave, deslocamento, tamanho in descricao["layout"]}
+    _AVALIADOR["memoria"] = memoria
+    _AVALIADOR["avaliador"] = _Avaliador(descricao, base, dados)
+
+
+def _avaliar(tarefa):
+    candidato, semente_avaliacao = tarefa
+    return _AVALIADOR["avaliador"].avaliar(candidato, semente_avaliacao)
+
+
+class BuscaEvolutiva:
+    """
+    Estratégia de evolução sobre as forças e tendências da rede, avaliada em dados_avaliacao
+    (pares entrada/saída reservados). Com trabalhadores > 1, os candidatos são avaliados em um
+    ProcessPoolExecutor. Use como gerenciador de contexto, ou chame fechar() ao terminar.
+    """
+
+    def __init__(self, rede, dados_avaliacao, populacao=8, trabalhadores=None, semente=None, selecionados=None):
+        self.rede = rede
+        self.dados = list(dados_avaliacao)
+        self.populacao = populacao
+        self.selecionados = selecionados or max(1, populacao // 4)
+        self.rng = random.Random(semente if semente is not None else random.getrandbits(64))
+        self.layout, self.total = layout_parametros(rede)
+        descricao = descricao_rede(rede, self.layout, self.total)
+        self.memoria = None
+        self.executor = None
+        self.parametros = {}
+        if trabalhadores is not None and trabalhadores > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            from multiprocessing import shared_memory
+
+            self.memoria = shared_memory.SharedMemory(create=True, size=8 * self.total)
+            self.parametros = {chave: visao_memoria(self.memoria, deslocamento, tamanho, descricao["backend"])
+                               for chave, deslocamento, tamanho in self.layout}
+            try:
+                self.executor = ProcessPoolExecutor(trabalhadores, initializer=_iniciar_avaliador,
+                                                    initargs=(self.memoria.name, descricao, self.dados))
+            except Exception:
+                self._liberar_memoria()
+                raise
+            self.avaliador = None
+        else:
+            base = {}
+            for chave, _, _ in self.layout:
+                nome, vetor = chave.split(".")
+                base[chave] = getattr(getattr(rede, nome), vetor)
+            self.avaliador = _Avaliador(descricao, base, self.dados)
+
+    def _avaliar_todos(self, candidatos, semente_avaliacao):
+        if self.executor is None:
+            return [self.avaliador.avaliar(c, semente_avaliacao) for c in candidatos]
+        for chave, destino in self.parametros.items():
+            nome, vetor = chave.split(".")
+            destino[:] = getattr(getattr(self.rede, nome), vetor)
+        return list(self.executor.map(_avaliar, [(c, semente_avaliacao) for c in candidatos]))
+
+    def geracao(self, escala):
+        """
+        Executa uma geração com ruído uniforme em ±escala e aplica à rede o melhor resultado.
+        Retorna o erro de avaliação da rede após a geração.
+        """
+        semente_avaliacao = self.rng.getrandbits(64)
+        candidatos = [[]] + [[(self.rng.getrandbits(64), escala)] for _ in range(self.populacao)]
+        erros = self._avaliar_todos(candidatos, semente_avaliacao)
+        # Recombinação: média dos ruídos dos melhores candidatos
+        ordem = sorted(range(1, len(candidatos)), key=erros.__getitem__)[:self.selecionados]
+        recombinado = [(candidatos[i][0][0], escala / len(ordem)) for i in ordem]
+        candidatos.append(recombinado)
+        erros += self._avaliar_todos([recombinado], semente_avaliacao)
+
+        melhor = min(range(len(candidatos)), key=erros.__getitem__)
+        camadas = [self.rede.camada_oculta, self.rede.camada_saida]
+        for semente, escala_ruido in candidatos[melhor]:
+            MotorPerturbacao(semente).perturbar(camadas, escala_ruido)
+        return erros[melhor]
+
+    def _liberar_memoria(self):
+        self.parametros = {}
+        self.memoria.close()
+        self.memoria.unlink()
+
+    def fechar(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self._liberar_memoria()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.fechar()
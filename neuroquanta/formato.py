@@ -0,0 +1,228 @@
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+import warnings
+from .backend import np, resolver_backend, para_array
+
+# Formato binário .nqn
+#
+#   offset 0   MAGICA (4 bytes) = b"NQN\0"
+#   offset 4   versão (uint16, little-endian)
+#   offset 6   reservado (uint16)
+#   offset 8   tamanho do cabeçalho JSON em bytes (uint32, little-endian)
+#   offset 12  cabeçalho JSON (UTF-8): arquitetura, transformer e a tabela de vetores
+#   ...        vetores float64 little-endian, cada um alinhado em 64 bytes
+#
+# Cada entrada da tabela "vetores" tem nome, deslocamento (a partir do início do arquivo) e
+# tamanho (em elementos). Na leitura o arquivo é mapeado em memória e os vetores viram visões
+# sem cópia (numpy.frombuffer ou memoryview.cast('d')).
+
+MAGICA = b"NQN\0"
+VERSAO = 1
+_PREFIXO = struct.Struct("<4sHHI")
+_ALINHAMENTO = 64
+
+# Parâmetros do transformer que podem ir para o cabeçalho
+_TIPOS_CONFIG = (bool, int, float, str, type(None))
+
+
+def _alinhar(posicao):
+    return (posicao + _ALINHAMENTO - 1) // _ALINHAMENTO * _ALINHAMENTO
+
+
+def _bytes_le(valores):
+    # Bytes float64 little-endian de um vetor de parâmetros
+    if np is not None and isinstance(valores, np.ndarray):
+        return np.ascontiguousarray(valores, dtype="<f8").tobytes()
+    valores = para_array(valores)
+    if sys.byteorder != "little":
+        valores.byteswap()
+    return valores.tobytes()
+
+
+def config_transformer(transformer):
+    """
+    Configuração serializável (JSON) de um transformer: classe e parâmetros escalares.
+    """
+    if transformer is None:
+        return None
+    parametros = {chave: valor for chave, valor in vars(transformer).items()
+                  if not chave.startswith("_") and isinstance(valor, _TIPOS_CONFIG)}
+    return {"classe": type(transformer).__name__, "parametros": parametros}
+
+
+def salvar(rede, caminho):
+    """
+    Grava a rede no formato binário .nqn, no caminho informado (com extensão).
+    """
+    from . import Camada
+
+    camadas = {"camada_oculta": rede.camada_oculta, "camada_saida": rede.camada_saida}
+    dados = []
+    tabela = []
+    for nome_camada, camada in camadas.items():
+        for nome in Camada.VETORES:
+            bruto = _bytes_le(getattr(camada, nome))
+            tabela.append({"nome": f"{nome_camada}.{nome}", "tamanho": len(bruto) // 8})
+            dados.append(bruto)
+    cabecalho = {
+        "versao": VERSAO,
+        "arquitetura": {
+            "tamanho_entrada": rede.tamanho_entrada,
+            "tamanho_oculto": rede.tamanho_oculto,
+            "tamanho_saida": rede.tamanho_saida,
+        },
+        "camadas": {nome: {"num_celulas": c.num_celulas, "num_entradas": c.num_entradas}
+                    for nome, c in camadas.items()},
+        "transformer": config_transformer(rede.transformer),
+        "vetores": tabela,
+    }
+    # Os deslocamentos dependem do tamanho do próprio cabeçalho: reserva espaço e ajusta
+    # até o cabeçalho parar de crescer
+    inicio = 0
+    while True:
+        posicao = inicio
+        for entrada in tabela:
+            entrada["deslocamento"] = posicao
+            posicao = _alinhar(posicao + 8 * entrada["tamanho"])
+        texto = json.dumps(cabecalho, ensure_ascii=False).encode("utf-8")
+        necessario = _alinhar(_PREFIXO.size + len(texto))
+        if necessario <= inicio:
+            break
+        inicio = necessario
+    # Grava em um arquivo temporário e troca de uma vez: modelos ainda mapeados a partir do
+    # arquivo antigo continuam válidos
+    temporario = caminho + ".tmp"
+    with open(temporario, "wb") as f:
+        f.write(_PREFIXO.pack(MAGICA, VERSAO, 0, len(texto)))
+        f.write(texto)
+        for entrada, bruto in zip(tabela, dados):
+            f.write(b"\0" * (entrada["deslocamento"] - f.tell()))
+            f.write(bruto)
+    os.replace(temporario, caminho)
+
+
+def eh_formato_binario(caminho):
+    """
+    Indica se o arquivo está no formato binário (e não no formato legado em pickle).
+    """
+    with open(caminho, "rb") as f:
+        return f.read(len(MAGICA)) == MAGICA
+
+
+def ler_cabecalho(dados):
+    """
+    Lê e valida o cabeçalho de um buffer no formato binário, retornando o dicionário JSON.
+    """
+    magica, versao, _, tamanho = _PREFIXO.unpack_from(dados, 0)
+    if magica != MAGICA:
+        raise ValueError("Arquivo não está no formato binário .nqn.")
+    if versao > VERSAO:
+        raise ValueError(f"Versão {versao} do formato .nqn não suportada (máximo {VERSAO}).")
+    return json.loads(bytes(dados[_PREFIXO.size:_PREFIXO.size + tamanho]).decode("utf-8"))
+
+
+def _visao(mapa, deslocamento, tamanho, backend):
+    # Visão sem cópia sobre o arquivo mapeado (cópia só em máquinas big-endian sem NumPy)
+    if backend == "numpy":
+        return np.frombuffer(mapa, dtype="<f8", count=tamanho, offset=deslocamento)
+    visao = memoryview(mapa)[deslocamento:deslocamento + 8 * tamanho]
+    if sys.byteorder == "little":
+        return visao.cast("d")
+    valores = para_array(visao.cast("d"))
+    valores.byteswap()
+    return valores
+
+
+def carregar(caminho, backend=None, permitir_legado=False):
+    """
+    Carrega uma rede de um arquivo .nqn (caminho com extensão). O arquivo é mapeado em memória
+    em modo copy-on-write: os parâmetros são usados sem cópia e alterações (ex.: treino) não
+    são gravadas de volta no arquivo. Arquivos sem o cabeçalho binário são recusados, pois
+    o formato legado (pickle) executa código ao ser carregado; com permitir_legado=True, são
+    carregados com um aviso (só para arquivos de origem confiável).
+    """
+    if not eh_formato_binario(caminho):
+        if not permitir_legado:
+            raise ValueError(f"{caminho} não está no formato binário .nqn. Se for um modelo legado (pickle) de "
+                             "origem confiável, converta-o com python -m neuroquanta.formato ou carregue-o com "
+                             "permitir_legado=True.")
+        warnings.warn(f"{caminho} está no formato legado (pickle), que executa código ao ser carregado. "
+                      "Converta-o com neuroquanta.formato.converter_legado.", stacklevel=3)
+        return carregar_legado(caminho)
+
+    backend = resolver_backend(backend)
+    with open(caminho, "rb") as f:
+        mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    cabecalho = ler_cabecalho(mapa)
+    vetores = {v["nome"]: _visao(mapa, v["deslocamento"], v["tamanho"], backend)
+               for v in cabecalho["vetores"]}
+    return montar_rede(cabecalho["arquitetura"], cabecalho["camadas"], vetores, backend,
+                       cabecalho["transformer"])
+
+
+def transformer_de_config(config):
+    """
+    Recria um transformer a partir de config_transformer.
+    """
+    from . import CosmicResonanceModulator
+
+    if config is None:
+        return None
+    if config["classe"] != CosmicResonanceModulator.__name__:
+        raise ValueError(f"Transformer desconhecido: {config['classe']}.")
+    transformer = CosmicResonanceModulator()
+    vars(transformer).update(config["parametros"])
+    return transformer
+
+
+def montar_rede(arquitetura, camadas, vetores, backend, config=None):
+    """
+    Monta uma NeuroQuantaNetwork sobre vetores de parâmetros já existentes, sem copiá-los.
+    `camadas` mapeia o nome de cada camada para {"num_celulas", "num_entradas"} e `vetores`
+    mapeia "camada.vetor" (ex.: "camada_oculta.forcas") para o vetor correspondente.
+    """
+    from . import Camada, NeuroQuantaNetwork
+
+    rede = NeuroQuantaNetwork.__new__(NeuroQuantaNetwork)
+    rede.__dict__.update(arquitetura)
+    for nome, dimensoes in camadas.items():
+        camada = Camada.__new__(Camada)
+        camada._usar_vetores(dimensoes["num_celulas"], dimensoes["num_entradas"],
+                             *(vetores[f"{nome}.{v}"] for v in Camada.VETORES), backend=backend)
+        setattr(rede, nome, camada)
+    rede.transformer = None
+    transformer = transformer_de_config(config)
+    if transformer is not None:
+        rede.integrar_transformer(transformer)
+    return rede
+
+
+def carregar_legado(caminho):
+    """
+    Carrega um modelo no formato legado (objeto NeuroQuantaNetwork serializado com pickle).
+    Só use com arquivos de origem confiável: pickle pode executar código arbitrário.
+    """
+    with open(caminho, "rb") as f:
+        return pickle.load(f)
+
+
+def converter_legado(origem, destino):
+    """
+    Converte um arquivo .nqn legado (pickle) para o formato binário.
+    """
+    salvar(carregar_legado(origem), destino)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Converte modelos .nqn legados (pickle) para o formato binário.")
+    parser.add_argument("origem", help="arquivo .nqn legado")
+    parser.add_argument("destino", help="arquivo .nqn de saída")
+    args = parser.parse_args()
+    converter_legado(args.origem, args.destino)
+    print(f"Modelo convertido: {args.origem} -> {args.destino}")
@@ -0,0 +1,134 @@
+import cProfile
+import io
+import pstats
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+# Instrumentação da rede: eventos de progresso, tempos por fase e perfil opcional.
+#
+# A rede e o modulador têm o atributo de classe `instrumentacao = None`; os laços quentes só
+# fazem `if inst is not None` antes de medir, então a instrumentação desligada não custa
+# nada além desse teste. Para ligá-la:
+#
+#     inst = Instrumentacao(callbacks=[imprimir_progresso])
+#     rede.instrumentar(inst)
+#     rede.treinar(...)
+#     print(inst.relatorio())
+#
+# Fases medidas: "frente" (camadas), "modulador" (modulação harmônica), "atencao",
+# "retropropagacao", "perturbacao" e "softmax" (escolha do token e top-k na geração).
+# Eventos emitidos: "passo" (cada lote do treino), "epoca", "reforco" (ciclo de melhoria
+# dentro do treino), "melhoria" (a cada 100 épocas de melhorar_modelo) e "token" (cada token
+# gerado). Cada callback recebe (evento, dados), com dados em um dicionário.
+
+
+class Instrumentacao:
+    """
+    Coleta tempos e contagens por fase e repassa eventos de progresso aos callbacks.
+    Com temporizar=False só os eventos são emitidos. Com perfil=True, treinar e
+    melhorar_modelo rodam sob cProfile (ver estatisticas_perfil).
+    """
+
+    def __init__(self, callbacks=(), temporizar=True, perfil=False):
+        self.callbacks = list(callbacks)
+        self.temporizar = temporizar
+        self.perfil_automatico = perfil
+        self.perfil = None
+        self._profundidade_perfil = 0
+        self.zerar()
+
+    def zerar(self):
+        """
+        Descarta os tempos e contadores acumulados.
+        """
+        self.tempos = {}
+        self.chamadas = {}
+        self.contadores = {}
+
+    def adicionar_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def evento(self, nome, **dados):
+        """
+        Repassa um evento de progresso a todos os callbacks.
+        """
+        for callback in self.callbacks:
+            callback(nome, dados)
+
+    def relogio(self):
+        return perf_counter() if self.temporizar else 0.0
+
+    def fase(self, nome, inicio):
+        """
+        Acumula o tempo decorrido desde `inicio` (obtido de relogio) na fase `nome` e retorna
+        o instante atual, para encadear a medição da fase seguinte.
+        """
+        if not self.temporizar:
+            return 0.0
+        agora = perf_counter()
+        self.tempos[nome] = self.tempos.get(nome, 0.0) + (agora - inicio)
+        self.chamadas[nome] = self.chamadas.get(nome, 0) + 1
+        return agora
+
+    def contar(self, nome, quantidade=1):
+        self.contadores[nome] = self.contadores.get(nome, 0) + quantidade
+
+    def relatorio(self):
+        """
+        Resumo das medições: para cada fase, tempo total, número de chamadas e tempo médio
+        (em segundos); e os contadores.
+        """
+        fases = {nome: {"segundos": total, "chamadas": self.chamadas[nome],
+                        "media": total / self.chamadas[nome]}
+                 for nome, total in self.tempos.items()}
+        return {"fases": fases, "contadores": dict(self.contadores)}
+
+    @contextmanager
+    def perfilar(self):
+        """
+        Executa o bloco sob cProfile (criado sob demanda). Chamadas aninhadas reaproveitam
+        o perfil já ativo.
+        """
+        if self.perfil is None:
+            self.perfil = cProfile.Profile()
+        self._profundidade_perfil += 1
+        if self._profundidade_perfil == 1:
+            self.perfil.enable()
+        try:
+            yield self.perfil
+        finally:
+            self._profundidade_perfil -= 1
+            if self._profundidade_perfil == 0:
+                self.perfil.disable()
+
+    def estatisticas_perfil(self, ordem="cumulative", limite=20):
+        """
+        Texto com as funções mais custosas do perfil coletado, ou "" se não houver perfil.
+        """
+        if self.perfil is None:
+            return ""
+        saida = io.StringIO()
+        pstats.Stats(self.perfil, stream=saida).sort_stats(ordem).print_stats(limite)
+        return saida.getvalue()
+
+
+def imprimir_progresso(evento, dados):
+    """
+    Callback que imprime o progresso do treino e da melhoria, como a rede fazia antes.
+    """
+    if evento == "reforco":
+        print(f"Treinamento {dados['epoca']}/{dados['epocas']} completado com reforço")
+    elif evento == "melhoria":
+        if dados.get("erro") is None:
+            print(f"Melhoria {dados['epoca']}/{dados['epocas']} executada.")
+        else:
+            print(f"Melhoria {dados['epoca']}/{dados['epocas']} executada (erro {dados['erro']:.6f}).")
+
+
+def perfil_automatico(instrumentacao):
+    """
+    Contexto de perfil para treinar/melhorar_modelo: ativo só com Instrumentacao(perfil=True).
+    """
+    if instrumentacao is not None and instrumentacao.perfil_automatico:
+        return instrumentacao.perfilar()
+    return nullcontext()
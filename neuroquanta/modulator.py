@@ -1,11 +1,39 @@
 import math
 import random  # Adicionado para suportar jitter na fase
+from contextlib import contextmanager
+from .backend import np, PADRAO
+from .atencao import atencao_exata, atencao_rapida, retropropagar_atencao
+from .esparso import VetorEsparso
+
+# Abaixo deste número de ativações, listas são transformadas em Python puro: o custo fixo
+# das chamadas NumPy supera o ganho da vetorização
+_MINIMO_NUMPY = 256
+
+
+def _usar_numpy(valores, elementos):
+    if np is None:
+        return False
+    return isinstance(valores, np.ndarray) or (PADRAO == "numpy" and elementos >= _MINIMO_NUMPY)
 
 # Módulo CosmicResonanceModulator:
 # Transforma as ativações aplicando modulação harmônica com variação de fase e combinação de funções senoidais e cosenoidais,
 # promovendo uma ressonância cósmica que harmoniza os sinais da rede, diferenciando-a das arquiteturas feed-forward convencionais.
 class CosmicResonanceModulator:
-    def __init__(self, config='padrao', tem_atencao=False, camadas_atencao=1):
+    # Padrões da atenção (também usados por modelos salvos antes destes parâmetros existirem)
+    modo_atencao = 'exato'
+    tolerancia_atencao = 1e-4
+    corte_atencao = None
+    # Instrumentação opcional, normalmente ligada pela rede (NeuroQuantaNetwork.instrumentar)
+    instrumentacao = None
+    # Semente do jitter e geradores próprios, criados no primeiro uso (ver _geradores)
+    semente = None
+    _rng = None
+    _rng_np = None
+    # Entradas de cada camada de atenção no último transform_lote (ver retropropagar)
+    _entradas_atencao = None
+
+    def __init__(self, config='padrao', tem_atencao=False, camadas_atencao=1,
+                 modo_atencao='exato', tolerancia_atencao=1e-4, corte_atencao=None, semente=None):
         if config == 'inovadora':
             self.modulation = 1.5  # Intensidade maior para acelerar as transformações
             self.phase = math.pi / 2  # Fase base elevada para modulação mais dinâmica
@@ -17,38 +45,224 @@ class CosmicResonanceModulator:
         # Armazena os novos parâmetros para atenção
         self.tem_atencao = tem_atencao
         self.camadas_atencao = camadas_atencao
+        # 'exato' calcula todos os pares; 'rapido' ordena as ativações e soma apenas as vizinhas
+        # dentro do raio de corte do kernel, com erro por elemento limitado por tolerancia_atencao
+        if modo_atencao not in ('exato', 'rapido'):
+            raise ValueError(f"modo_atencao deve ser 'exato' ou 'rapido', recebido {modo_atencao!r}.")
+        if tolerancia_atencao <= 0:
+            raise ValueError("tolerancia_atencao deve ser positiva.")
+        self.modo_atencao = modo_atencao
+        self.tolerancia_atencao = tolerancia_atencao
+        self.corte_atencao = corte_atencao
+        # Com semente, o jitter é reprodutível e independente do gerador global `random`
+        self.semente = semente
+
+    def semear(self, semente):
+        """
+        Reinicia o gerador de jitter do modulador com a semente informada.
+        """
+        self.semente = semente
+        self._rng = random.Random(semente)
+        self._rng_np = np.random.default_rng(semente) if np is not None else None
+
+    @contextmanager
+    def semeado(self):
+        """
+        Executa o bloco com geradores novos, criados a partir de `semente`, e restaura os
+        anteriores ao sair: as transformações do bloco dependem só da entrada e da semente, sem
+        consumir a sequência de sorteios das demais chamadas. Requer uma semente.
+        """
+        if self.semente is None:
+            raise ValueError("semeado requer um modulador com semente.")
+        anteriores = self._rng, self._rng_np
+        self.semear(self.semente)
+        try:
+            yield
+        finally:
+            self._rng, self._rng_np = anteriores
+
+    def _geradores(self):
+        # Criados no primeiro uso: sem semente, ela vem do gerador global `random`, de modo
+        # que um random.seed anterior ao primeiro uso torna as transformações reprodutíveis
+        if self._rng is None:
+            semente = self.semente if self.semente is not None else random.getrandbits(64)
+            self._rng = random.Random(semente)
+            self._rng_np = np.random.default_rng(semente) if np is not None else None
+        return self._rng, self._rng_np
 
     def transform(self, activations):
-        # Calcula a média e o desvio padrão das ativações
-        media = sum(activations) / len(activations)
-        std = (sum((a - media) ** 2 for a in activations) / len(activations)) ** 0.5
-
-        transformed = []
-        for a in activations:
-            # Calcula uma fase ajustada com jitter
-            phase_adjusted = self.phase + random.uniform(-self.jitter, self.jitter)
+        """
+        Transforma um vetor de ativações (um lote de uma linha em transform_lote).
+        Retorna o mesmo tipo recebido: ndarray para ndarray, lista caso contrário (também para
+        um VetorEsparso, cuja transformação é densa).
+        """
+        if isinstance(activations, VetorEsparso):
+            transformed = self.transform_lote([activations])[0]
+            return transformed.tolist() if np is not None and isinstance(transformed, np.ndarray) else transformed
+        if _usar_numpy(activations, len(activations)):
+            transformed = self.transform_lote(np.asarray(activations, dtype=np.float64)[None, :])[0]
+            return transformed if isinstance(activations, np.ndarray) else transformed.tolist()
+        return self.transform_lote([activations])[0]  # Retorna as ativações transformadas
+
+    def _atencao(self, linhas):
+        # Cada camada recalcula as ativações como média ponderada pela similaridade Gaussiana.
+        # As entradas de cada camada ficam guardadas para a retropropagação
+        entradas = []
+        for _ in range(self.camadas_atencao):
+            entradas.append(linhas)
+            if self.modo_atencao == 'rapido':
+                linhas = [atencao_rapida(linha, self.tolerancia_atencao, self.corte_atencao) for linha in linhas]
+            else:
+                linhas = [atencao_exata(linha) for linha in linhas]
+        self._entradas_atencao = entradas
+        return linhas
+
+    def transform_lote(self, matriz):
+        """
+        Transforma um lote de ativações (uma linha por exemplo): cada ativação recebe a modulação
+        harmônica com fase perturbada por jitter uniforme e, nas linhas com desvio padrão muito
+        pequeno (sistema preso), um impulso uniforme em ±0.5.
+        Os sorteios vêm do gerador próprio do modulador (ver semear), em um bloco por lote.
+        Com NumPy, estatísticas e modulação são vetorizadas sobre a matriz inteira.
+        Retorna um ndarray para entradas ndarray, ou uma lista de listas caso contrário.
+        Um lote de VetorEsparso só calcula a modulação dos elementos não nulos (ver
+        _transform_esparso) e retorna um ndarray quando processado com NumPy.
+        """
+        rng, rng_np = self._geradores()
+        inst = self.instrumentacao
+        inicio = inst.relogio() if inst is not None else 0.0
+        if not (np is not None and isinstance(matriz, np.ndarray)) and matriz and isinstance(matriz[0], VetorEsparso):
+            resultado = [self._transform_esparso(vetor, rng, rng_np) for vetor in matriz]
+            if inst is not None:
+                inicio = inst.fase("modulador", inicio)
+            if self.tem_atencao:
+                resultado = self._atencao(resultado)
+                if inst is not None:
+                    inst.fase("atencao", inicio)
+            if np is not None and isinstance(resultado[0], np.ndarray):
+                resultado = np.array(resultado)
+            return resultado
+        if _usar_numpy(matriz, len(matriz) * len(matriz[0]) if len(matriz) else 0):
+            a = np.asarray(matriz, dtype=np.float64)
+            lote, n = a.shape
+            # Calcula uma fase ajustada com jitter para cada ativação
+            phase_adjusted = self.phase + self.jitter * (2 * rng_np.random((lote, n)) - 1)
             # Aplica modulação combinando funções senoidal e cosenoidal com decaimento exponencial
-            modulated = a + self.modulation * (math.sin(a * phase_adjusted) + math.cos(a * phase_adjusted)) * math.exp(-abs(a))
+            transformed = a + self.modulation * (np.sin(a * phase_adjusted) + np.cos(a * phase_adjusted)) * np.exp(-np.abs(a))
             # Se o desvio padrão for muito pequeno (sistema preso), adiciona um impulso extra
-            if std < 0.01:
-                modulated += random.uniform(-0.5, 0.5)
-            transformed.append(modulated)
+            desvios = a - a.sum(axis=1, keepdims=True) / n
+            presas = np.einsum("ij,ij->i", desvios, desvios) / n < 0.01 ** 2
+            if presas.any():
+                transformed[presas] += rng_np.random((int(presas.sum()), n)) - 0.5
+            if inst is not None:
+                inicio = inst.fase("modulador", inicio)
+            if self.tem_atencao:
+                transformed = np.array(self._atencao(list(transformed)))
+                if inst is not None:
+                    inst.fase("atencao", inicio)
+            return transformed if isinstance(matriz, np.ndarray) else transformed.tolist()
 
-        # Se o mecanismo de atenção estiver ativado, aplica uma camada simples de self-attention
+        sortear = rng.random
+        sin, cos, exp = math.sin, math.cos, math.exp
+        base = self.phase - self.jitter
+        largura = 2 * self.jitter
+        modulation = self.modulation
+        resultado = []
+        for linha in matriz:
+            # Calcula a média e o desvio padrão das ativações
+            n = len(linha)
+            media = sum(linha) / n
+            std = (sum((a - media) ** 2 for a in linha) / n) ** 0.5
+            transformed = []
+            for a in linha:
+                p = base + largura * sortear()
+                transformed.append(a + modulation * (sin(a * p) + cos(a * p)) * exp(-abs(a)))
+            if std < 0.01:
+                transformed = [t + sortear() - 0.5 for t in transformed]
+            resultado.append(transformed)
+        if inst is not None:
+            inicio = inst.fase("modulador", inicio)
         if self.tem_atencao:
-            for _ in range(self.camadas_atencao):
-                new_transformed = []
-                # Para cada ativação, recalcula seu valor com base na similaridade com as demais
-                for i in range(len(transformed)):
-                    # Usa similaridade Gaussiana para calcular os pesos de atenção
-                    weights = [math.exp(-((transformed[i] - transformed[j]) ** 2)) for j in range(len(transformed))]
-                    weight_sum = sum(weights)
-                    # Atualiza a ativação como média ponderada das ativações
-                    new_value = sum(weights[j] * transformed[j] for j in range(len(transformed))) / weight_sum
-                    new_transformed.append(new_value)
-                transformed = new_transformed
-
-        return transformed  # Retorna as ativações transformadas
+            resultado = self._atencao(resultado)
+            if inst is not None:
+                inst.fase("atencao", inicio)
+        return resultado
+
+    def _transform_esparso(self, vetor, rng, rng_np):
+        # Um zero é levado exatamente a `modulation`, qualquer que seja o jitter:
+        # 0 + modulation * (sin(0) + cos(0)) * exp(0). Só os não nulos são calculados; média e
+        # desvio padrão vêm das somas dos não nulos
+        n = vetor.tamanho
+        indices, valores = vetor.indices, vetor.valores
+        media = sum(valores) / n
+        presa = max(sum(v * v for v in valores) / n - media * media, 0.0) < 0.01 ** 2
+        # Sem atenção, a escolha do NumPy depende só do número de não nulos: preencher a linha
+        # densa com `modulation` custa pouco em Python puro. Com atenção, a linha densa segue
+        # para uma soma O(n²), e o backend é escolhido pelo tamanho denso, como no caminho denso
+        if _usar_numpy(None, n if self.tem_atencao else len(valores)):
+            a = np.asarray(valores, dtype=np.float64)
+            phase_adjusted = self.phase + self.jitter * (2 * rng_np.random(len(a)) - 1)
+            linha = np.full(n, float(self.modulation))
+            linha[np.asarray(indices, dtype=np.intp)] = a + self.modulation * (np.sin(a * phase_adjusted) + np.cos(a * phase_adjusted)) * np.exp(-np.abs(a))
+            if presa:
+                linha += rng_np.random(n) - 0.5
+            return linha
+        sortear = rng.random
+        base = self.phase - self.jitter
+        largura = 2 * self.jitter
+        modulation = self.modulation
+        linha = [modulation] * n
+        for j, a in zip(indices, valores):
+            p = base + largura * sortear()
+            linha[j] = a + modulation * (math.sin(a * p) + math.cos(a * p)) * math.exp(-abs(a))
+        if presa:
+            linha = [t + sortear() - 0.5 for t in linha]
+        return linha
+
+    def derivada(self, matriz):
+        """
+        Derivada elemento a elemento da modulação harmônica em relação às ativações de entrada,
+        usada pela retropropagação. Usa a fase base (o jitter tem média zero); o impulso extra
+        é aditivo. A atenção é atravessada antes, por retropropagar_atencao.
+        Recebe e retorna um lote (ndarray ou lista de linhas).
+        """
+        m = self.modulation
+        p = self.phase
+        if np is not None and isinstance(matriz, np.ndarray):
+            a = matriz
+            sin = np.sin(a * p)
+            cos = np.cos(a * p)
+            return 1 + m * np.exp(-np.abs(a)) * (p * (cos - sin) - np.sign(a) * (sin + cos))
+        resultado = []
+        for linha in matriz:
+            derivadas = []
+            for a in linha:
+                sin = math.sin(a * p)
+                cos = math.cos(a * p)
+                sinal = (a > 0) - (a < 0)
+                derivadas.append(1 + m * math.exp(-abs(a)) * (p * (cos - sin) - sinal * (sin + cos)))
+            resultado.append(derivadas)
+        return resultado
+
+    def retropropagar_atencao(self, deltas):
+        """
+        Leva os deltas em relação à saída do modulador (um lote) aos deltas em relação à saída
+        da modulação harmônica, atravessando as camadas de atenção do último transform_lote pela
+        Jacobiana exata de cada uma (no modo 'rapido', a da soma exata que ele aproxima).
+        Sem atenção, retorna os deltas inalterados.
+        """
+        if not self.tem_atencao:
+            return deltas
+        entradas = self._entradas_atencao
+        if entradas is None or len(entradas[0]) != len(deltas):
+            raise RuntimeError("retropropagar_atencao requer o transform_lote do mesmo lote.")
+        if np is not None and isinstance(deltas, np.ndarray):
+            for linhas in reversed(entradas):
+                deltas = retropropagar_atencao(np.asarray(linhas, dtype=np.float64), deltas)
+            return deltas
+        for linhas in reversed(entradas):
+            deltas = [retropropagar_atencao(list(linha), delta) for linha, delta in zip(linhas, deltas)]
+        return deltas
 
     def generate_response(self, initial_state, steps):
         """
@@ -0,0 +1,192 @@
+import random
+from array import array
+from operator import add
+from .backend import np, zeros
+from .formato import config_transformer, montar_rede
+
+# Treino com paralelismo de dados: cada lote é dividido entre processos trabalhadores, que
+# calculam os gradientes da sua parte e os devolvem por memória compartilhada.
+#
+# O bloco compartilhado guarda, em float64, os parâmetros publicados pelo processo principal
+# (forças e tendências das duas camadas) seguidos de uma área de gradientes por trabalhador.
+# Os trabalhadores montam sua rede diretamente sobre a área de parâmetros (sem cópia), de modo
+# que a cada lote só trafegam as entradas da parte, os parâmetros escalares do transformer
+# (que melhorar_modelo também altera) e um número (o erro).
+
+# Cada lote é dividido entre os trabalhadores (o conjunto de dados não é particionado), e
+# cada passo paga um custo fixo de ~2 ms (serializar as partes, sincronizar o pool e somar
+# os gradientes), medido em uma rede 64-32-64. Abaixo deste tamanho de lote esse custo supera
+# o cálculo dividido e o treino paralelo fica mais lento que o serial (treinar emite um aviso).
+LOTE_MINIMO = 256
+
+_CAMADAS = ("camada_oculta", "camada_saida")
+_VETORES = ("forcas", "tendencias")
+
+# Estado de cada processo trabalhador, preenchido por _iniciar_trabalhador
+_TRABALHADOR = {}
+
+
+def layout_parametros(rede):
+    """
+    (chave, deslocamento, tamanho) de cada vetor compartilhado, em número de floats, e o total.
+    """
+    layout = []
+    posicao = 0
+    for nome in _CAMADAS:
+        camada = getattr(rede, nome)
+        for vetor in _VETORES:
+            tamanho = len(getattr(camada, vetor))
+            layout.append((f"{nome}.{vetor}", posicao, tamanho))
+            posicao += tamanho
+    return layout, posicao
+
+
+def visao_memoria(memoria, deslocamento, tamanho, backend):
+    """
+    Vetor de floats sem cópia sobre um trecho de um bloco SharedMemory.
+    """
+    if backend == "numpy":
+        return np.frombuffer(memoria.buf, dtype=np.float64, count=tamanho, offset=8 * deslocamento)
+    return memoria.buf[8 * deslocamento:8 * (deslocamento + tamanho)].cast("d")
+
+
+def descricao_rede(rede, layout, total):
+    """
+    Tudo o que um processo trabalhador precisa para remontar a rede: arquitetura, dimensões das
+    camadas, configuração do transformer, backend e layout da memória compartilhada.
+    """
+    return {
+        "backend": rede.camada_oculta.backend,
+        "layout": layout,
+        "total": total,
+        "arquitetura": {"tamanho_entrada": rede.tamanho_entrada,
+                        "tamanho_oculto": rede.tamanho_oculto,
+                        "tamanho_saida": rede.tamanho_saida},
+        "camadas": {nome: {"num_celulas": getattr(rede, nome).num_celulas,
+                           "num_entradas": getattr(rede, nome).num_entradas} for nome in _CAMADAS},
+        "transformer": config_transformer(rede.transformer),
+    }
+
+
+def _iniciar_trabalhador(nome_memoria, descricao):
+    from multiprocessing import shared_memory
+
+    # Os trabalhadores compartilham o resource_tracker do processo principal, que remove o bloco
+    memoria = shared_memory.SharedMemory(name=nome_memoria)
+    backend = descricao["backend"]
+    vetores = {}
+    for chave, deslocamento, tamanho in descricao["layout"]:
+        vetores[chave] = visao_memoria(memoria, deslocamento, tamanho, backend)
+        # Os buffers de momentum ficam só no processo principal
+        vetores[chave + "_velocidade"] = zeros(tamanho, backend)
+    _TRABALHADOR["memoria"] = memoria
+    _TRABALHADOR["descricao"] = descricao
+    _TRABALHADOR["rede"] = montar_rede(descricao["arquitetura"], descricao["camadas"], vetores, backend,
+                                       descricao["transformer"])
+
+
+def _calcular_parte(tarefa):
+    # Calcula a soma dos gradientes de uma parte do lote e grava na área do trabalhador
+    area, entradas, alvos, semente, parametros = tarefa
+    rede = _TRABALHADOR["rede"]
+    descricao = _TRABALHADOR["descricao"]
+    if rede.transformer is not None:
+        # Parâmetros atuais do transformer do processo principal (ex.: modulation após melhorar_modelo)
+        vars(rede.transformer).update(parametros)
+        rede.transformer.semear(semente)
+    rede.prever_lote(entradas)
+    erro, gradientes = rede.calcular_gradientes(alvos)
+    n = len(entradas)
+    valores = [g for par in gradientes for g in par]
+    base = descricao["total"] * (1 + area)
+    for (_, deslocamento, tamanho), g in zip(descricao["layout"], valores):
+        destino = visao_memoria(_TRABALHADOR["memoria"], base + deslocamento, tamanho, descricao["backend"])
+        if descricao["backend"] == "numpy":
+            destino[:] = g * n
+        else:
+            destino[:] = array("d", [v * n for v in g])
+    return erro * n
+
+
+class TreinoParalelo:
+    """
+    Executa passos de treino com os lotes divididos entre `trabalhadores` processos.
+    Os gradientes das partes são somados sempre na mesma ordem e as sementes de cada parte
+    derivam de `semente` (ou do gerador global `random`), então o resultado é determinístico.
+    Use como gerenciador de contexto, ou chame fechar() ao terminar.
+    """
+
+    def __init__(self, rede, trabalhadores, semente=None):
+        from multiprocessing import Pool, shared_memory
+
+        self.rede = rede
+        self.trabalhadores = trabalhadores
+        self.rng = random.Random(semente if semente is not None else random.getrandbits(64))
+        self.backend = rede.camada_oculta.backend
+        self.layout, self.total = layout_parametros(rede)
+        self.memoria = shared_memory.SharedMemory(create=True, size=8 * self.total * (1 + trabalhadores))
+        self.parametros = {chave: visao_memoria(self.memoria, deslocamento, tamanho, self.backend)
+                           for chave, deslocamento, tamanho in self.layout}
+        descricao = descricao_rede(rede, self.layout, self.total)
+        try:
+            self.pool = Pool(trabalhadores, initializer=_iniciar_trabalhador,
+                             initargs=(self.memoria.name, descricao))
+        except Exception:
+            self._liberar_memoria()
+            raise
+
+    def _publicar(self):
+        # Copia os parâmetros atuais do processo principal para a memória compartilhada e
+        # retorna os parâmetros escalares do transformer, enviados junto com cada parte
+        for chave, destino in self.parametros.items():
+            nome, vetor = chave.split(".")
+            destino[:] = getattr(getattr(self.rede, nome), vetor)
+        config = config_transformer(self.rede.transformer)
+        return config["parametros"] if config is not None else None
+
+    def passo(self, entradas, alvos, taxa_aprendizado, momentum=0.9):
+        """
+        Um passo de descida do gradiente sobre o lote, calculado em paralelo.
+        Retorna o erro médio do lote (mesma medida de retropropagar).
+        """
+        parametros = self._publicar()
+        n = len(entradas)
+        tamanho_parte = -(-n // self.trabalhadores)
+        tarefas = []
+        for area, inicio in enumerate(range(0, n, tamanho_parte)):
+            fim = inicio + tamanho_parte
+            tarefas.append((area, list(entradas[inicio:fim]), list(alvos[inicio:fim]), self.rng.getrandbits(64),
+                           parametros))
+        erros = self.pool.map(_calcular_parte, tarefas, chunksize=1)
+
+        gradientes = []
+        for chave, deslocamento, tamanho in self.layout:
+            soma = None
+            for area in range(len(tarefas)):
+                parte = visao_memoria(self.memoria, self.total * (1 + area) + deslocamento, tamanho, self.backend)
+                if self.backend == "numpy":
+                    soma = parte.copy() if soma is None else soma + parte
+                else:
+                    soma = array("d", parte) if soma is None else array("d", map(add, soma, parte))
+            if self.backend == "numpy":
+                gradientes.append(soma / n)
+            else:
+                gradientes.append(array("d", [g / n for g in soma]))
+        self.rede.aplicar_gradientes([gradientes[0:2], gradientes[2:4]], taxa_aprendizado, momentum)
+        return sum(erros) / n
+
+    def _liberar_memoria(self):
+        self.parametros = {}
+        self.memoria.close()
+        self.memoria.unlink()
+
+    def fechar(self):
+        self.pool.close()
+        self.pool.join()
+        self._liberar_memoria()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.fechar()
@@ -0,0 +1,82 @@
+import math
+import random
+from array import array
+from operator import add
+from .backend import np
+
+# Até este número de épocas fundidas, o ruído é a soma exata de sorteios uniformes
+# (distribuição de Irwin-Hall); acima disso usa-se a normal de mesma variância (TLC).
+SOMA_EXATA_MAX = 12
+
+
+def soma_senos(inicio, fim):
+    """
+    Soma de sin(e) para e em range(inicio, fim), em forma fechada.
+    """
+    k = fim - inicio
+    if k <= 0:
+        return 0.0
+    return math.sin(k / 2) * math.sin(inicio + (k - 1) / 2) / math.sin(0.5)
+
+
+class MotorPerturbacao:
+    """
+    Gera ruído uniforme em blocos para todos os parâmetros de uma lista de camadas e aplica
+    o ajuste em uma única atualização vetorizada.
+    Várias épocas sem avaliação entre elas podem ser fundidas em um só passo: a soma de
+    `passos` sorteios uniformes em [-escala, escala] é reproduzida exatamente até
+    SOMA_EXATA_MAX passos e, acima disso, aproximada pela normal com a mesma variância.
+    Sem semente explícita, a semente vem do gerador global `random`, de modo que
+    random.seed continua tornando o processo reprodutível.
+    """
+
+    def __init__(self, semente=None):
+        if semente is None:
+            semente = random.getrandbits(64)
+        self.semente = semente
+        self.rng = random.Random(semente)
+        self.rng_np = np.random.default_rng(semente) if np is not None else None
+
+    def ruido(self, n, escala, passos=1, backend="array"):
+        """
+        Retorna n valores, cada um distribuído como a soma de `passos` sorteios
+        uniformes em [-escala, escala].
+        """
+        if backend == "numpy":
+            rng = self.rng_np
+            if passos > SOMA_EXATA_MAX:
+                return rng.normal(0.0, escala * math.sqrt(passos / 3), n)
+            bloco = rng.uniform(-escala, escala, n)
+            for _ in range(passos - 1):
+                bloco += rng.uniform(-escala, escala, n)
+            return bloco
+        if passos > SOMA_EXATA_MAX:
+            gauss = self.rng.gauss
+            desvio = escala * math.sqrt(passos / 3)
+            return array("d", [gauss(0.0, desvio) for _ in range(n)])
+        sortear = self.rng.random
+        largura = 2 * escala
+        bloco = array("d", [largura * sortear() - escala for _ in range(n)])
+        for _ in range(passos - 1):
+            bloco = array("d", [b + largura * sortear() - escala for b in bloco])
+        return bloco
+
+    def perturbar(self, camadas, escala, passos=1):
+        """
+        Soma a perturbação de `passos` épocas às forças e tendências de todas as camadas,
+        gerando um único bloco de ruído para o conjunto inteiro de parâmetros.
+        """
+        vetores = []
+        for camada in camadas:
+            vetores.append(camada.forcas)
+            vetores.append(camada.tendencias)
+        backend = camadas[0].backend if camadas else "array"
+        bloco = self.ruido(sum(len(v) for v in vetores), escala, passos, backend)
+        inicio = 0
+        for valores in vetores:
+            fim = inicio + len(valores)
+            if backend == "numpy":
+                valores += bloco[inicio:fim]
+            else:
+                valores[:] = array("d", map(add, valores, bloco[inicio:fim]))
+            inicio = fim
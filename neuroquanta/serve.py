@@ -0,0 +1,399 @@
+"""
+Servidor local de inferência do NeuroQuanta.
+
+Uso:
+    python -m neuroquanta.serve modelo.nqn --tokenizer tokenizer.json --porta 8080
+    python -m neuroquanta.serve modelo.nqn --tokenizer tokenizer.json --socket /tmp/neuroquanta.sock
+
+O modelo e o tokenizador são carregados uma única vez. O protocolo é HTTP/1.1 com corpo JSON,
+sobre TCP local ou socket Unix:
+
+    POST /tokenizar  {"texto": "..."} ou {"textos": [...]}          -> {"tokens": ...}
+    POST /prever     {"entrada": [...]} / {"entradas": [[...], ...]} ou {"texto": "..."}
+                                                                     -> {"saida": ...} / {"saidas": ...}
+    POST /gerar      {"prompt": "..."} ou {"tokens": [...]}, opcionais max_steps (até --max-passos),
+                     penalidade_repeticao e token_parada             -> {"tokens": [...], "texto": "..."}
+    GET  /saude                                                      -> estado das filas
+
+Pedidos de /prever e /gerar que chegam dentro de uma janela curta (--espera-ms) são agrupados em
+micro-lotes de até --lote-max itens, executados com prever_lote e gerar_resposta_lote. Cada fila
+aceita no máximo --fila-max pedidos pendentes; acima disso o servidor responde 503 (contrapressão)
+em vez de acumular latência. Pedidos que não terminam em --tempo-limite segundos recebem 504.
+
+O tamanho do estado de geração é o vocabulário do tokenizador (ou --tamanho-vocab, sem
+tokenizador); pedidos não podem alterá-lo. Como um 504 não interrompe o trabalho já em execução,
+max_steps é limitado por --max-passos, e em um micro-lote cada sequência sai ao atingir o seu
+próprio max_steps.
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import Tokenizer
+
+# Maior corpo de requisição aceito, em bytes
+CORPO_MAXIMO = 1 << 20
+
+_STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+           504: "Gateway Timeout"}
+
+
+class ErroPedido(Exception):
+    """
+    Erro que vira uma resposta HTTP com o status informado.
+    """
+
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+
+class Agrupador:
+    """
+    Fila que agrupa pedidos em micro-lotes: o primeiro pedido abre uma janela de `espera`
+    segundos, e o lote é processado quando a janela fecha ou quando atinge `tamanho_lote` itens.
+    `processar` recebe a lista de itens e retorna a lista de resultados, na mesma ordem; ele roda
+    em `executor`, fora do laço de eventos. Com `parcial`, `processar` recebe também uma função
+    entregar(indice, resultado), que responde um pedido antes do fim do lote. Com `capacidade`
+    pedidos pendentes, novos pedidos são recusados com ErroPedido(503).
+    """
+
+    def __init__(self, processar, executor, tamanho_lote=32, espera=0.005, capacidade=256, parcial=False):
+        self.processar = processar
+        self.parcial = parcial
+        self.executor = executor
+        self.tamanho_lote = tamanho_lote
+        self.espera = espera
+        self.fila = asyncio.Queue(capacidade)
+        self.lotes = 0
+        self.itens = 0
+        self._tarefa = None
+
+    def iniciar(self):
+        self._tarefa = asyncio.ensure_future(self._laco())
+
+    async def parar(self):
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+
+    async def submeter(self, item):
+        """
+        Enfileira o item e aguarda o seu resultado.
+        """
+        futuro = asyncio.get_running_loop().create_future()
+        try:
+            self.fila.put_nowait((item, futuro))
+        except asyncio.QueueFull:
+            raise ErroPedido(503, "Servidor sobrecarregado; tente novamente.")
+        return await futuro
+
+    async def _laco(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pendentes = [await self.fila.get()]
+            prazo = loop.time() + self.espera
+            while len(pendentes) < self.tamanho_lote:
+                restante = prazo - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    pendentes.append(await asyncio.wait_for(self.fila.get(), restante))
+                except asyncio.TimeoutError:
+                    break
+            # Pedidos cujo cliente já desistiu (tempo limite) não entram no lote
+            pendentes = [(item, futuro) for item, futuro in pendentes if not futuro.done()]
+            if not pendentes:
+                continue
+            self.lotes += 1
+            self.itens += len(pendentes)
+            argumentos = [[item for item, _ in pendentes]]
+            if self.parcial:
+                argumentos.append(self._entregador(loop, [futuro for _, futuro in pendentes]))
+            try:
+                resultados = await loop.run_in_executor(self.executor, self.processar, *argumentos)
+            except Exception as erro:
+                for _, futuro in pendentes:
+                    if not futuro.done():
+                        futuro.set_exception(erro)
+                continue
+            for (_, futuro), resultado in zip(pendentes, resultados):
+                if not futuro.done():
+                    futuro.set_result(resultado)
+
+    @staticmethod
+    def _entregador(loop, futuros):
+        # Chamado no thread do executor: o resultado é entregue pelo laço de eventos
+        def responder(futuro, resultado):
+            if not futuro.done():
+                futuro.set_result(resultado)
+
+        def entregar(indice, resultado):
+            loop.call_soon_threadsafe(responder, futuros[indice], resultado)
+        return entregar
+
+    def estado(self):
+        return {"pendentes": self.fila.qsize(), "lotes": self.lotes, "itens": self.itens,
+                "media_por_lote": self.itens / self.lotes if self.lotes else 0.0}
+
+
+class Servidor:
+    """
+    Serve tokenização, previsão e geração de uma rede (e de um tokenizador opcional) já
+    carregados. Todo acesso à rede passa por um único thread, pois prever_lote guarda estado
+    nas camadas.
+    """
+
+    def __init__(self, rede, tokenizer=None, tamanho_lote=32, espera=0.005, capacidade=256, tempo_limite=30.0,
+                 max_passos=256, tamanho_vocab=None):
+        self.rede = rede
+        self.tokenizer = tokenizer
+        self.max_passos = max_passos
+        if tamanho_vocab is None and tokenizer is not None:
+            tamanho_vocab = len(tokenizer.vocab)
+        elif tamanho_vocab is not None and tokenizer is not None and tamanho_vocab != len(tokenizer.vocab):
+            raise ValueError(f"tamanho_vocab ({tamanho_vocab}) difere do vocabulário do tokenizador "
+                             f"({len(tokenizer.vocab)}).")
+        self.tamanho_vocab = tamanho_vocab
+        self.tamanho_lote = tamanho_lote
+        self.espera = espera
+        self.capacidade = capacidade
+        self.tempo_limite = tempo_limite
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.rotas = {"/tokenizar": self.tokenizar, "/prever": self.prever, "/gerar": self.gerar}
+        self.servidor = None
+
+    async def iniciar(self, host="127.0.0.1", porta=8080, caminho_socket=None):
+        self.agrupador_prever = Agrupador(self._prever_lote, self.executor, self.tamanho_lote,
+                                          self.espera, self.capacidade)
+        self.agrupador_gerar = Agrupador(self._gerar_lote, self.executor, self.tamanho_lote,
+                                         self.espera, self.capacidade, parcial=True)
+        self.agrupador_prever.iniciar()
+        self.agrupador_gerar.iniciar()
+        if caminho_socket is not None:
+            self.servidor = await asyncio.start_unix_server(self._conexao, path=caminho_socket)
+        else:
+            self.servidor = await asyncio.start_server(self._conexao, host, porta)
+        return self.servidor
+
+    async def parar(self):
+        if self.servidor is not None:
+            self.servidor.close()
+            await self.servidor.wait_closed()
+        await self.agrupador_prever.parar()
+        await self.agrupador_gerar.parar()
+        self.executor.shutdown()
+
+    def _exigir_tokenizer(self):
+        if self.tokenizer is None:
+            raise ErroPedido(400, "Servidor iniciado sem tokenizador (--tokenizer).")
+        return self.tokenizer
+
+    # Rotas: recebem o corpo JSON já decodificado e retornam o objeto da resposta
+    async def tokenizar(self, corpo):
+        tokenizer = self._exigir_tokenizer()
+        if "textos" in corpo:
+            return {"tokens": [list(seq) for seq in tokenizer.tokenizar_lote(corpo["textos"])]}
+        if "texto" in corpo:
+            return {"tokens": tokenizer.tokenizar(corpo["texto"])}
+        raise ErroPedido(400, "Informe 'texto' ou 'textos'.")
+
+    async def prever(self, corpo):
+        # As entradas são validadas aqui: um pedido inválido não pode derrubar o micro-lote inteiro
+        if "entradas" in corpo:
+            entradas = [[float(v) for v in linha] for linha in corpo["entradas"]]
+            return {"saidas": await self._submeter(self.agrupador_prever, entradas)}
+        if "entrada" in corpo:
+            entrada = [float(v) for v in corpo["entrada"]]
+        elif "texto" in corpo:
+            entrada = self._exigir_tokenizer().tokenizar(corpo["texto"])
+        else:
+            raise ErroPedido(400, "Informe 'entrada', 'entradas' ou 'texto'.")
+        saidas = await self._submeter(self.agrupador_prever, [entrada])
+        return {"saida": saidas[0]}
+
+    async def gerar(self, corpo):
+        if "tokens" in corpo:
+            tokens = [int(t) for t in corpo["tokens"]]
+            if any(t < 0 for t in tokens):
+                raise ErroPedido(400, "Ids de token devem ser não negativos.")
+        elif "prompt" in corpo:
+            tokens = self._exigir_tokenizer().tokenizar(corpo["prompt"])
+        else:
+            raise ErroPedido(400, "Informe 'prompt' ou 'tokens'.")
+        if self.tamanho_vocab is None:
+            raise ErroPedido(400, "Servidor iniciado sem tokenizador nem --tamanho-vocab.")
+        if corpo.get("tamanho_vocab") is not None and int(corpo["tamanho_vocab"]) != self.tamanho_vocab:
+            raise ErroPedido(400, f"tamanho_vocab deve ser {self.tamanho_vocab} (o vocabulário do modelo servido).")
+        max_steps = int(corpo.get("max_steps", min(self.tokenizer.max_len if self.tokenizer else 20, self.max_passos)))
+        if not 0 <= max_steps <= self.max_passos:
+            raise ErroPedido(400, f"max_steps deve estar entre 0 e {self.max_passos}.")
+        pedido = {
+            "tokens": tokens,
+            "max_steps": max_steps,
+            "penalidade_repeticao": float(corpo.get("penalidade_repeticao", 0.7)),
+            "token_parada": None if corpo.get("token_parada") is None else int(corpo["token_parada"]),
+        }
+        resposta = await self._submeter(self.agrupador_gerar, pedido)
+        resultado = {"tokens": resposta}
+        if self.tokenizer is not None:
+            resultado["texto"] = self.tokenizer.para_texto(resposta)
+        return resultado
+
+    async def _submeter(self, agrupador, item):
+        try:
+            return await asyncio.wait_for(agrupador.submeter(item), self.tempo_limite)
+        except asyncio.TimeoutError:
+            raise ErroPedido(504, "Tempo limite excedido.")
+
+    # Processamento dos micro-lotes (no thread do executor)
+    def _prever_lote(self, itens):
+        linhas = [linha for entradas in itens for linha in entradas]
+        saidas = self.rede.prever_lote(linhas) if linhas else []
+        resultados = []
+        inicio = 0
+        for entradas in itens:
+            resultados.append(saidas[inicio:inicio + len(entradas)])
+            inicio += len(entradas)
+        return resultados
+
+    def _gerar_lote(self, itens, entregar):
+        # Pedidos com a mesma penalidade e token de parada são gerados juntos; cada sequência sai
+        # do lote ao atingir o seu próprio max_steps e é respondida na hora, sem esperar as mais longas
+        grupos = {}
+        for posicao, item in enumerate(itens):
+            chave = (item["penalidade_repeticao"], item["token_parada"])
+            grupos.setdefault(chave, []).append(posicao)
+        resultados = [None] * len(itens)
+        for (penalidade, token_parada), posicoes in grupos.items():
+            respostas = self.rede.gerar_resposta_lote([itens[p]["tokens"] for p in posicoes],
+                                                      [itens[p]["max_steps"] for p in posicoes],
+                                                      penalidade_repeticao=penalidade,
+                                                      token_parada=token_parada, tamanho_vocab=self.tamanho_vocab,
+                                                      ao_terminar=lambda i, r, posicoes=posicoes: entregar(posicoes[i], r))
+            for p, resposta in zip(posicoes, respostas):
+                resultados[p] = resposta
+        return resultados
+
+    def estado(self):
+        return {"status": "ok", "prever": self.agrupador_prever.estado(), "gerar": self.agrupador_gerar.estado()}
+
+    # HTTP/1.1 mínimo, com conexões persistentes
+    async def _conexao(self, reader, writer):
+        try:
+            while True:
+                linha = await reader.readline()
+                if not linha:
+                    break
+                try:
+                    metodo, caminho, versao = linha.decode("latin-1").split()
+                except ValueError:
+                    await self._responder(writer, 400, {"erro": "Requisição inválida."}, manter=False)
+                    break
+                cabecalhos = {}
+                while True:
+                    linha = await reader.readline()
+                    if linha in (b"\r\n", b"\n", b""):
+                        break
+                    nome, _, valor = linha.decode("latin-1").partition(":")
+                    cabecalhos[nome.strip().lower()] = valor.strip()
+                manter = versao == "HTTP/1.1" and cabecalhos.get("connection", "").lower() != "close"
+                tamanho = int(cabecalhos.get("content-length", 0) or 0)
+                if tamanho > CORPO_MAXIMO:
+                    await self._responder(writer, 413, {"erro": "Corpo grande demais."}, manter=False)
+                    break
+                corpo = await reader.readexactly(tamanho) if tamanho else b""
+                status, resposta = await self._despachar(metodo, caminho, corpo)
+                await self._responder(writer, status, resposta, manter)
+                if not manter:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _despachar(self, metodo, caminho, corpo):
+        if caminho == "/saude":
+            return 200, self.estado()
+        rota = self.rotas.get(caminho)
+        if rota is None:
+            return 404, {"erro": f"Rota desconhecida: {caminho}"}
+        if metodo != "POST":
+            return 405, {"erro": "Use POST."}
+        try:
+            dados = json.loads(corpo or b"{}")
+            if not isinstance(dados, dict):
+                raise ErroPedido(400, "O corpo deve ser um objeto JSON.")
+            return 200, await rota(dados)
+        except ErroPedido as erro:
+            return erro.status, {"erro": str(erro)}
+        except (ValueError, TypeError, KeyError, IndexError) as erro:
+            return 400, {"erro": f"Pedido inválido: {erro}"}
+        except Exception as erro:
+            return 500, {"erro": f"{type(erro).__name__}: {erro}"}
+
+    async def _responder(self, writer, status, objeto, manter=True):
+        corpo = json.dumps(objeto, ensure_ascii=False).encode("utf-8")
+        cabecalho = (f"HTTP/1.1 {status} {_STATUS[status]}\r\n"
+                     "Content-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(corpo)}\r\n"
+                     f"Connection: {'keep-alive' if manter else 'close'}\r\n")
+        if status == 503:
+            cabecalho += "Retry-After: 1\r\n"
+        writer.write(cabecalho.encode("latin-1") + b"\r\n" + corpo)
+        await writer.drain()
+
+
+async def servir(rede, tokenizer=None, host="127.0.0.1", porta=8080, caminho_socket=None, **opcoes):
+    """
+    Inicia o servidor e atende até ser cancelado.
+    """
+    servidor = Servidor(rede, tokenizer, **opcoes)
+    await servidor.iniciar(host, porta, caminho_socket)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await servidor.parar()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m neuroquanta.serve", description="Servidor local do NeuroQuanta.")
+    parser.add_argument("modelo", help="arquivo .nqn do modelo")
+    parser.add_argument("--tokenizer", help="arquivo JSON do tokenizador (Tokenizer.salvar)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8080)
+    parser.add_argument("--socket", help="serve em um socket Unix neste caminho, em vez de TCP")
+    parser.add_argument("--backend", choices=("array", "numpy"), help="backend dos parâmetros")
+    parser.add_argument("--lote-max", type=int, default=32, help="itens por micro-lote")
+    parser.add_argument("--espera-ms", type=float, default=5.0, help="janela de agrupamento, em milissegundos")
+    parser.add_argument("--fila-max", type=int, default=256, help="pedidos pendentes por fila antes de responder 503")
+    parser.add_argument("--tempo-limite", type=float, default=30.0, help="segundos até responder 504")
+    parser.add_argument("--max-passos", type=int, default=256, help="maior max_steps aceito em /gerar")
+    parser.add_argument("--tamanho-vocab", type=int,
+                        help="tamanho do estado de geração, sem tokenizador (com ele, o seu vocabulário)")
+    args = parser.parse_args(argv)
+
+    from .formato import carregar
+
+    inicio = time.perf_counter()
+    rede = carregar(args.modelo, backend=args.backend)
+    tokenizer = Tokenizer.carregar(args.tokenizer) if args.tokenizer else None
+    endereco = args.socket or f"http://{args.host}:{args.porta}"
+    print(f"Modelo carregado em {time.perf_counter() - inicio:.3f} s; servindo em {endereco}")
+    try:
+        asyncio.run(servir(rede, tokenizer, args.host, args.porta, args.socket,
+                           tamanho_lote=args.lote_max, espera=args.espera_ms / 1000,
+                           capacidade=args.fila_max, tempo_limite=args.tempo_limite,
+                           max_passos=args.max_passos, tamanho_vocab=args.tamanho_vocab))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,79 @@
+import json
 import re
+from array import array
+from .cache import CacheLRU, AUSENTE
+from .esparso import VetorEsparso
+
+# Regex compilada uma única vez, que separa:
+# - Sequências de caracteres alfanuméricos (palavras)
+# - Cada caractere que não for alfanumérico (ex.: pontuações, espaços)
+_PADRAO_TOKENS = re.compile(r'\w+|[^\w]')
 
 class Tokenizer:
+    # Cache opcional de tokenizar (ver ativar_cache)
+    cache = None
+    # Versão do vocabulário, incrementada a cada atribuição de vocab (invalida o cache)
+    _versao_vocab = 0
+
     def __init__(self, minusculas=False, usar_espacos=True):
         self.minusculas = minusculas
         self.usar_espacos = usar_espacos
         self.vocab = ["<PAD>"]  # Token de preenchimento no índice 0
         self.max_len = 0        # Comprimento máximo das sequências
 
+    @property
+    def vocab(self):
+        return self._vocab
+
+    @vocab.setter
+    def vocab(self, tokens):
+        # Atribuir um novo vocabulário reconstrói o índice token -> id
+        self._vocab = tokens
+        self._versao_vocab += 1
+        self._reconstruir_indice()
+
+    def __setstate__(self, estado):
+        estado = dict(estado)
+        # Tokenizadores salvos antes da propriedade vocab guardam a lista em "vocab"
+        vocab = estado.pop("vocab", None)
+        self.__dict__.update(estado)
+        if vocab is not None:
+            self.vocab = vocab
+        elif "_tamanho_indice" not in estado:
+            self._reconstruir_indice()
+
+    def _reconstruir_indice(self):
+        # Mantém a primeira ocorrência de cada token, como vocab.index
+        indice = {}
+        for i, token in enumerate(self._vocab):
+            indice.setdefault(token, i)
+        self.indice = indice
+        self._tamanho_indice = len(self._vocab)
+
+    def _sincronizar_indice(self):
+        # Atribuições de vocab reconstroem o índice no setter; aqui só se cobrem tokens
+        # acrescentados diretamente à lista (vocab.append)
+        if self._tamanho_indice != len(self._vocab):
+            self._reconstruir_indice()
+        return self.indice
+
     def _split_tokens(self, texto):
         # Se minusculas estiver ativo, converte para lower case
         if self.minusculas:
             texto = texto.lower()
-        # Utiliza uma regex que separa:
-        # - Sequências de caracteres alfanuméricos (palavras)
-        # - Cada caractere que não for alfanumérico (ex.: pontuações, espaços)
-        tokens = re.findall(r'\w+|[^\w]', texto)
-        return tokens
+        return _PADRAO_TOKENS.findall(texto)
 
     def adicionar(self, lista_textos):
         """
-        Processa uma lista de textos, atualiza o vocabulário e guarda o comprimento máximo.
+        Processa textos, atualiza o vocabulário e guarda o comprimento máximo.
+        Aceita qualquer iterável de textos (lista, gerador...) ou um arquivo aberto em modo texto,
+        caso em que cada linha (sem a quebra de linha) é um texto. Os textos são processados um a
+        um, sem materializar o corpus em memória.
         """
+        if hasattr(lista_textos, "read"):
+            lista_textos = (linha.rstrip("\r\n") for linha in lista_textos)
+        vocab = self.vocab
+        indice = self._sincronizar_indice()
         for texto in lista_textos:
             tokens = self._split_tokens(texto)
             # Atualiza o comprimento máximo se necessário
@@ -28,8 +81,18 @@ class Tokenizer:
                 self.max_len = len(tokens)
             # Adiciona cada token único (respeitando a ordem de aparecimento)
             for token in tokens:
-                if token not in self.vocab:
-                    self.vocab.append(token)
+                if token not in indice:
+                    indice[token] = len(vocab)
+                    vocab.append(token)
+        self._tamanho_indice = len(vocab)
+
+    def ativar_cache(self, capacidade=4096):
+        """
+        Liga um cache LRU de até `capacidade` resultados de tokenizar, indexado pelo texto (com
+        capacidade None, desliga). O cache é esvaziado quando o vocabulário ou max_len mudam.
+        Estatísticas em tokenizer.cache.estatisticas().
+        """
+        self.cache = CacheLRU(capacidade) if capacidade else None
 
     @property
     def tam_vocabulario(self):
@@ -41,19 +104,44 @@ class Tokenizer:
         Cada token é mapeado para seu índice no vocabulário (a ordem dos tokens é preservada).
         Se a sequência for menor que self.max_len, preenche com 0 (PAD).
         """
-        tokens = self._split_tokens(texto)
-        seq = []
-        for token in tokens:
-            try:
-                idx = self.vocab.index(token)
-            except ValueError:
-                idx = 0  # fallback para PAD (não esperado)
-            seq.append(idx)
+        cache = self.cache
+        if cache is None:
+            return list(self._codificar(texto, self._sincronizar_indice().get))
+        # adicionar só acrescenta tokens; atribuições de vocab mudam _versao_vocab
+        cache.validar((self._versao_vocab, len(self.vocab), self.max_len))
+        seq = cache.obter(texto)
+        if seq is AUSENTE:
+            seq = self._codificar(texto, self._sincronizar_indice().get)
+            cache.guardar(texto, seq)
+        return list(seq)
+
+    def _codificar(self, texto, buscar):
+        # Tokens desconhecidos viram 0 (PAD), como fallback
+        seq = array("i", [buscar(token, 0) for token in self._split_tokens(texto)])
         # Preenche (pad) se necessário para garantir tamanho fixo
         if len(seq) < self.max_len:
-            seq += [0] * (self.max_len - len(seq))
+            seq.frombytes(bytes(seq.itemsize * (self.max_len - len(seq))))
         return seq
 
+    def tokenizar_esparso(self, texto):
+        """
+        Versão esparsa de tokenizar: um VetorEsparso de tamanho self.max_len com os pares
+        (posição, id) dos tokens conhecidos, sem materializar o preenchimento com PAD.
+        Pode ser passado diretamente a prever, prever_lote e treinar.
+        """
+        buscar = self._sincronizar_indice().get
+        tokens = self._split_tokens(texto)
+        tamanho = max(self.max_len, len(tokens))
+        return VetorEsparso(((posicao, buscar(token, 0)) for posicao, token in enumerate(tokens)), tamanho)
+
+    def tokenizar_lote(self, textos):
+        """
+        Versão em lote de tokenizar: aceita qualquer iterável de textos e retorna uma lista de
+        sequências compactas array('i'), com o mesmo preenchimento (PAD) de tokenizar.
+        """
+        buscar = self._sincronizar_indice().get
+        return [self._codificar(texto, buscar) for texto in textos]
+
     def para_texto(self, seq):
         # Atualizado para lidar com listas aninhadas (ex.: tokens de atenção)
         if seq and isinstance(seq[0], list):
@@ -69,6 +157,39 @@ class Tokenizer:
             tokens = [self.vocab[i] if i < len(self.vocab) else str(i) for i in indices]
             return " ".join(tokens)
 
+    def para_texto_lote(self, seqs):
+        """
+        Versão em lote de para_texto: converte cada sequência de índices em texto.
+        """
+        vocab = self.vocab
+        tamanho = len(vocab)
+        textos = []
+        for seq in seqs:
+            indices = [int(round(x)) for x in seq]
+            textos.append(" ".join([vocab[i] if i < tamanho else str(i) for i in indices]))
+        return textos
+
+    def salvar(self, caminho):
+        """
+        Grava o tokenizador em JSON (configuração, vocabulário e comprimento máximo).
+        """
+        estado = {"minusculas": self.minusculas, "usar_espacos": self.usar_espacos,
+                  "max_len": self.max_len, "vocab": self.vocab}
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump(estado, f, ensure_ascii=False)
+
+    @classmethod
+    def carregar(cls, caminho):
+        """
+        Carrega um tokenizador gravado com salvar.
+        """
+        with open(caminho, encoding="utf-8") as f:
+            estado = json.load(f)
+        tokenizer = cls(minusculas=estado["minusculas"], usar_espacos=estado["usar_espacos"])
+        tokenizer.vocab = estado["vocab"]
+        tokenizer.max_len = estado["max_len"]
+        return tokenizer
+
     def sequence_to_tokens(self, seq):
         """
         Método auxiliar para converter uma sequência de índices para a lista de tokens.
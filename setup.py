@@ -10,6 +10,9 @@ setup(
     author_email='icarojose533@gmail.com',
     packages=find_packages(),
     install_requires=[],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Intended Audience :: Science/Research',
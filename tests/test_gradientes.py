@@ -0,0 +1,65 @@
+import random
+import unittest
+
+from neuroquanta import NeuroQuantaNetwork, CosmicResonanceModulator, Camada
+from neuroquanta.backend import np
+
+BACKENDS = ("array", "numpy") if np is not None else ("array",)
+
+
+def _rede(backend, tem_atencao, camadas_atencao=2):
+    random.seed(7)
+    rede = NeuroQuantaNetwork(6, 5, 4)
+    rede.camada_oculta = Camada(5, 6, backend=backend)
+    rede.camada_saida = Camada(4, 5, backend=backend)
+    modulador = CosmicResonanceModulator(config='inovadora', tem_atencao=tem_atencao,
+                                         camadas_atencao=camadas_atencao, semente=0)
+    # Sem jitter o modulador é determinístico e a derivada analítica é exata
+    modulador.jitter = 0.0
+    rede.integrar_transformer(modulador)
+    dados = [([random.uniform(-1, 1) for _ in range(6)], [random.uniform(-1, 1) for _ in range(4)])
+             for _ in range(3)]
+    return rede, dados
+
+
+def _erro_relativo(analitico, numerico):
+    diferenca = max(abs(a - b) for a, b in zip(analitico, numerico))
+    escala = max(max(abs(b) for b in numerico), 1e-12)
+    return diferenca / escala
+
+
+class TestGradientes(unittest.TestCase):
+    """
+    Compara os gradientes de calcular_gradientes com diferenças centrais do erro de avaliar.
+    """
+
+    def verificar(self, backend, tem_atencao, passo=1e-6):
+        rede, dados = _rede(backend, tem_atencao)
+        rede.prever_lote([entrada for entrada, _ in dados])
+        _, gradientes = rede.calcular_gradientes([alvo for _, alvo in dados])
+        for camada, (g_forcas, g_tendencias) in zip([rede.camada_oculta, rede.camada_saida], gradientes):
+            for parametros, analitico in ((camada.forcas, g_forcas), (camada.tendencias, g_tendencias)):
+                numerico = []
+                for i in range(len(parametros)):
+                    original = parametros[i]
+                    parametros[i] = original + passo
+                    mais = rede.avaliar(dados)
+                    parametros[i] = original - passo
+                    menos = rede.avaliar(dados)
+                    parametros[i] = original
+                    numerico.append((mais - menos) / (2 * passo))
+                self.assertLess(_erro_relativo(list(analitico), numerico), 1e-5)
+
+    def test_sem_atencao(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                self.verificar(backend, tem_atencao=False)
+
+    def test_com_atencao(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                self.verificar(backend, tem_atencao=True)
+
+
+if __name__ == "__main__":
+    unittest.main()